@@ -25,18 +25,50 @@ Date: December 2025
 """
 
 from flask import Flask, render_template, request, jsonify
+from flask.json.provider import JSONProvider
 import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from managers.file_processor import FileProcessor
 from managers.hash_manager import HashManager
-from db.json_parser import build_similarity_index, load_db, DB_PATH
+from db.json_parser import (
+    add_to_similarity_index,
+    build_similarity_index,
+    clear_delta,
+    copy_similarity_index,
+    db_signature,
+    load_db,
+    load_index_cache,
+    save_index_cache,
+    DB_PATH,
+)
 import hashlib
-from datetime import datetime
+import io
+from datetime import datetime, timezone
 from db.json_parser import save_db
 
+# Optional fast JSON serializer for API responses
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Optional production WSGI server (see __main__)
+try:
+    from waitress import serve
+except ImportError:
+    serve = None
+
 
 # Configuration
 TOP_MATCHES = 10
 MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
+COMPARE_CACHE_SIZE = 256  # Max uploads remembered by /api/compare
+WSGI_THREADS = 8  # Request threads when served by waitress
+UPLOAD_CHUNK_SIZE = 64 * 1024  # Read/hash uploads in 64KB chunks
 
 # Logging config
 logging.basicConfig(
@@ -44,10 +76,302 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+class OrjsonProvider(JSONProvider):
+    """
+    Flask JSON provider backed by orjson.
+
+    Serializes API responses straight to bytes with orjson (written in Rust),
+    which is several times faster than the stdlib encoder for the nested
+    match lists returned by the API. NumPy scalars are serialized natively.
+    """
+
+    OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY if orjson else 0
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=self.OPTIONS).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, option=self.OPTIONS), mimetype="application/json"
+        )
+
+
 app = Flask(__name__)
+if orjson is not None:
+    app.json = OrjsonProvider(app)
+
+
+class IndexSnapshot:
+    """
+    Immutable view of the database and everything derived from it.
+
+    Request handlers read the module-level _snapshot once and use that
+    object for the whole request, so they never see a half-applied insert
+    or reload. Writers build a new snapshot and rebind _snapshot, which is
+    atomic in CPython, so reads need no locking.
+
+    Attributes:
+        database (dict): Complete file database {sha256: {metadata}}
+        similarity_index (dict): Index for fast similarity lookups
+                                (see build_similarity_index)
+        hash_manager (HashManager): Manager over this database and index
+    """
+
+    __slots__ = ("database", "similarity_index", "hash_manager")
+
+    def __init__(self, database, similarity_index):
+        """
+        Initialize the snapshot. Neither argument may be modified afterwards.
+
+        Args:
+            database (dict): Complete file database {sha256: {metadata}}
+            similarity_index (dict): Index built from that database
+        """
+        self.database = database
+        self.similarity_index = similarity_index
+        self.hash_manager = HashManager(database, similarity_index)
+
+
+_snapshot = None  # Current IndexSnapshot, replaced (never mutated) on changes
+_write_lock = threading.Lock()  # Serializes inserts and reloads
+
+# Memoized results, invalidated whenever the database changes
+# {sha256: (filename, file_type, file_size, similarity result)}
+_compare_cache = OrderedDict()
+_similar_cache = {}  # {sha256: (json_body, tlsh_cutoff, ssdeep_cutoff)}
+_cache_lock = threading.Lock()
+
+
+# Background database persistence (single writer, coalesced)
+_save_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-save")
+_save_pending = threading.Event()
+_save_error = None  # Error of the last background write, None once one succeeds
+
+# Signature of DB_PATH (and its delta log) as last loaded or written here
+_db_signature = None
+
+
+def _get_db_signature():
+    """
+    Get a cheap fingerprint of the database file and its delta log.
+
+    Returns:
+        tuple | None: See db_signature(), None if DB_PATH doesn't exist
+    """
+    return db_signature(DB_PATH)
+
+
+def _flush_db():
+    """
+    Write the in-memory database to disk atomically.
+
+    Runs on the background save thread. save_db() dumps the database to a
+    temporary file which then replaces DB_PATH, so a crash mid-write never
+    leaves a truncated JSON behind. Inserts that happen while the write is
+    in progress schedule another flush.
+
+    A failed write is kept in _save_error (reported by /api/health) until a
+    later flush succeeds; every insert schedules one, and it writes the whole
+    snapshot, so entries from the failed write are not lost.
+    """
+    global _db_signature, _save_error
+
+    _save_pending.clear()
+
+    # Snapshots are never modified, so this can be dumped without copying
+    snapshot = _snapshot.database
+
+    try:
+        save_db(snapshot, DB_PATH)
+        # Memory already includes any delta entries loaded at startup
+        clear_delta(DB_PATH)
+        # The file now matches memory, a reload doesn't need to re-parse it
+        _db_signature = _get_db_signature()
+        _save_error = None
+        logger.info(f"Database written to disk: {len(snapshot)} entries")
+    except Exception as e:
+        _save_error = str(e)
+        logger.error(f"Error writing database to disk: {e}")
+
+
+def _schedule_save():
+    """
+    Queue a database write unless one is already pending.
+
+    Several inserts in quick succession produce a single disk write.
+    """
+    if not _save_pending.is_set():
+        _save_pending.set()
+        _save_executor.submit(_flush_db)
+
+
+# (epoch seconds, ISO-8601 string) of the last generated timestamp
+_ts_cache = (0.0, "")
+
+# The pages are static apart from visualize's file_id: the landing HTML is
+# rendered once and the visualize template is only looked up once
+_landing_html = None
+_visualize_template = None
+
 
-database = {}
-similarity_index = {}
+def _iso_now():
+    """
+    Get the current UTC time as an ISO-8601 string ending in "Z".
+
+    The formatted string is reused for up to one second, so bulk inserts
+    don't pay for a datetime conversion each time.
+
+    Returns:
+        str: Timestamp such as "2025-12-03T16:36:04.710093Z"
+    """
+    global _ts_cache
+
+    t = time.time()
+    cached_t, cached_iso = _ts_cache
+    if t - cached_t < 1.0:
+        return cached_iso
+
+    iso = datetime.fromtimestamp(t, tz=timezone.utc).isoformat()
+    iso = iso.replace("+00:00", "Z")
+    _ts_cache = (t, iso)
+    return iso
+
+
+def _read_upload(file):
+    """
+    Read an uploaded file while calculating its SHA256.
+
+    The upload stream is consumed in UPLOAD_CHUNK_SIZE chunks and each chunk
+    feeds the hasher while it is still hot in cache. MD5 is not calculated
+    here, see _md5_if_needed(). Once the size exceeds
+    MAX_FILE_SIZE the rest of the stream is only counted, not buffered.
+    Chunks are collected in a BytesIO, whose getvalue() hands over its
+    buffer instead of copying the whole upload again.
+
+    Args:
+        file (FileStorage): Uploaded file from request.files
+
+    Returns:
+        tuple: (file_data, file_size, sha256_hex)
+            - file_data (bytes | None): Raw content, None if too large
+            - file_size (int): Total upload size in bytes
+            - sha256_hex (str | None): SHA256 of the content, None if too large
+    """
+    # Identification hash, not security: also allowed on FIPS builds
+    sha256 = hashlib.sha256(usedforsecurity=False)
+    buf = io.BytesIO()
+    file_size = 0
+
+    while True:
+        chunk = file.stream.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+
+        file_size += len(chunk)
+        if file_size > MAX_FILE_SIZE:
+            continue
+
+        buf.write(chunk)
+        sha256.update(chunk)
+
+    if file_size > MAX_FILE_SIZE:
+        return None, file_size, None
+
+    return buf.getvalue(), file_size, sha256.hexdigest()
+
+
+def _md5_if_needed(file_data, requested, saving):
+    """
+    Calculate the MD5 of an upload only when something uses it.
+
+    SHA256 already identifies the file, so MD5 is only a cosmetic field of
+    the /api/compare response. It costs a full extra pass over the upload,
+    so it is only calculated when the client asks for it (?md5=1) or when
+    the file is being saved, to keep the database entry complete.
+
+    Args:
+        file_data (bytes): Raw upload content
+        requested (bool): Whether the client passed md5=1
+        saving (bool): Whether the file will be added to the database
+
+    Returns:
+        str | None: MD5 hex digest, None if it isn't needed
+    """
+    if not (requested or saving):
+        return None
+    return hashlib.md5(file_data, usedforsecurity=False).hexdigest()
+
+
+def _cpu_has_sha_ni():
+    """
+    Check whether the CPU has the SHA extensions (SHA-NI).
+
+    hashlib uses OpenSSL, which switches to the SHA-NI instructions on its
+    own when they are present; this is only reported at startup to explain
+    upload hashing throughput.
+
+    Returns:
+        bool | None: True/False, None if /proc/cpuinfo can't be read
+    """
+    try:
+        with open("/proc/cpuinfo", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("flags"):
+                    return "sha_ni" in line.split()
+    except OSError:
+        pass
+    return None
+
+
+def _invalidate_similar_cache(snap, new_hashes):
+    """
+    Drop the memoized /api/file results that a newly added file changes.
+
+    A cached similar list only becomes stale if the new file would enter
+    its TLSH or ssdeep top matches, i.e. if it scores at least as well as
+    the worst cached match (or the top list wasn't full yet). Every other
+    cached entry stays valid.
+
+    Args:
+        snap (IndexSnapshot): Snapshot that includes the new file
+        new_hashes (dict): Hashes of the file just added to the database
+    """
+    with _cache_lock:
+        cached_items = list(_similar_cache.items())
+
+    for cached_sha256, (_, tlsh_cutoff, ssdeep_cutoff) in cached_items:
+        cached_hashes = snap.database.get(cached_sha256, {}).get("hashes", {})
+        tlsh_distance, ssdeep_similarity = snap.hash_manager.compare_hashes(
+            cached_hashes, new_hashes
+        )
+
+        enters_tlsh = tlsh_distance is not None and (
+            tlsh_cutoff is None or tlsh_distance <= tlsh_cutoff
+        )
+        enters_ssdeep = bool(ssdeep_similarity) and (
+            ssdeep_cutoff is None or ssdeep_similarity >= ssdeep_cutoff
+        )
+
+        if enters_tlsh or enters_ssdeep:
+            with _cache_lock:
+                _similar_cache.pop(cached_sha256, None)
+
+
+def _invalidate_caches():
+    """
+    Drop every memoized comparison result.
+
+    Must be called whenever the database or the similarity index change,
+    since cached match lists would otherwise be stale.
+    """
+    with _cache_lock:
+        _compare_cache.clear()
+        _similar_cache.clear()
 
 
 def initialize_app():
@@ -55,27 +379,44 @@ def initialize_app():
     Initialize the database and similarity index.
 
     Loads the JSON database from disk and builds an in-memory similarity
-    index for fast TLSH and ssdeep lookups.
+    index for fast TLSH and ssdeep lookups. Both are pickled next to the
+    database, so later starts with an unchanged file skip the JSON parsing
+    and the index build.
 
     Global Variables Modified:
-        database (dict): Complete file database {sha256: {metadata}}
-        similarity_index (dict): Index for fast similarity lookups
-                                {tlsh: {hash: sha256}, ssdeep: {hash: sha256}}
+        _snapshot (IndexSnapshot): Replaced with the database, similarity
+                                   index and HashManager that were loaded
+        _db_signature (tuple): Fingerprint of the file that was loaded
     """
-    global database, similarity_index
+    global _snapshot, _db_signature
+
+    with _write_lock:
+        logger.info(f"Loading database from {DB_PATH}...")
+        _db_signature = _get_db_signature()
+        cached = load_index_cache(_db_signature)
+        if cached is not None:
+            database, similarity_index = cached
+            logger.info(
+                f"Database and index loaded from cache: {len(database)} entries"
+            )
+        else:
+            database = load_db(DB_PATH)
+            logger.info(f"Database loaded: {len(database)} entries")
 
-    logger.info(f"Loading database from {DB_PATH}...")
-    database = load_db(DB_PATH)
-    logger.info(f"Database loaded: {len(database)} entries")
+            logger.info("Building similarity index...")
+            similarity_index = build_similarity_index(database)
+            logger.info(
+                f"Index built: {len(similarity_index['tlsh'])} TLSH, {len(similarity_index['ssdeep'])} ssdeep"
+            )
+            save_index_cache(_db_signature, database, similarity_index)
 
-    logger.info("Building similarity index...")
-    similarity_index = build_similarity_index(database)
-    logger.info(
-        f"Index built: {len(similarity_index['tlsh'])} TLSH, {len(similarity_index['ssdeep'])} ssdeep"
-    )
+        _snapshot = IndexSnapshot(database, similarity_index)
+
+        _invalidate_caches()
 
 
 initialize_app()
+logger.info(f"SHA-NI available for upload hashing: {_cpu_has_sha_ni()}")
 
 
 @app.route("/")
@@ -86,7 +427,15 @@ def landing():
     Returns:
         str: Rendered HTML template for the file upload page
     """
-    return render_template("landing.html")
+    global _landing_html
+
+    # Re-render on every request when templates are being edited (debug)
+    if app.jinja_env.auto_reload:
+        return render_template("landing.html")
+
+    if _landing_html is None:
+        _landing_html = render_template("landing.html")
+    return _landing_html
 
 
 @app.route("/visualize/<file_id>")
@@ -101,7 +450,111 @@ def visualize(file_id):
     Returns:
         str: Rendered HTML template with file visualization
     """
-    return render_template("visualize.html", file_id=file_id)
+    global _visualize_template
+
+    if app.jinja_env.auto_reload:
+        return render_template("visualize.html", file_id=file_id)
+
+    if _visualize_template is None:
+        _visualize_template = app.jinja_env.get_template("visualize.html")
+    return _visualize_template.render(file_id=file_id)
+
+
+def _merge_similar(tlsh_top, ssdeep_top):
+    """
+    Merge TLSH and ssdeep top matches into one entry per similar file.
+
+    Args:
+        tlsh_top (list): "top_matches" of HashManager.find_matches_tlsh()
+        ssdeep_top (list): "top_matches" of HashManager.find_matches_ssdeep()
+
+    Returns:
+        list: Similar files with their tlsh_score and ssdeep_score, in TLSH
+              order followed by the files only ssdeep found
+    """
+    # Keyed by sha256 so TLSH and ssdeep scores merge into a single entry
+    similar_map = {}
+
+    for match in tlsh_top:
+        similar_map[match["sha256"]] = {
+            "sha256": match["sha256"],
+            "name": match["name"],
+            "family": match.get("family", "Unknown"),
+            "file_type": match.get("file_type", "Unknown"),
+            "tags": match.get("tags", []),
+            "tlsh_score": max(0, 100 - match["distance"]),
+            "ssdeep_score": 0,
+        }
+
+    for match in ssdeep_top:
+        similar_entry = similar_map.get(match["sha256"])
+        if similar_entry is not None:
+            # Update existing entry with ssdeep score
+            similar_entry["ssdeep_score"] = match["similarity"]
+        else:
+            similar_map[match["sha256"]] = {
+                "sha256": match["sha256"],
+                "name": match["name"],
+                "family": match.get("family", "Unknown"),
+                "file_type": match.get("file_type", "Unknown"),
+                "tags": match.get("tags", []),
+                "tlsh_score": 0,
+                "ssdeep_score": match["similarity"],
+            }
+
+    return list(similar_map.values())
+
+
+def _recent_upload_response(file_sha256):
+    """
+    Build the /api/file response of a recent upload that wasn't saved.
+
+    /api/compare already found the matches of every upload it remembers
+    (see COMPARE_CACHE_SIZE). It only stores results computed against the
+    current snapshot, and writers clear the cache under the same lock after
+    publishing a new one, so those matches are still current and the file
+    doesn't need to be scanned again.
+
+    Args:
+        file_sha256 (str): SHA256 hash of the uploaded file
+
+    Returns:
+        Response | None: JSON response, None if the upload isn't remembered
+    """
+    with _cache_lock:
+        cached = _compare_cache.get(file_sha256)
+        if cached is not None:
+            _compare_cache.move_to_end(file_sha256)
+
+    if cached is None:
+        return None
+
+    filename, file_type, file_size, result = cached
+    tlsh_result = result["tlsh"]
+    ssdeep_result = result["ssdeep"]
+    similar = _merge_similar(
+        tlsh_result.get("matches", {}).get("top_matches", []),
+        ssdeep_result.get("matches", {}).get("top_matches", []),
+    )
+
+    logger.info(
+        f"Returning recent upload {file_sha256} with {len(similar)} similar files"
+    )
+    return jsonify(
+        {
+            "sha256": file_sha256,
+            "name": [filename],
+            "size": file_size,
+            "file_type": file_type,
+            "desc": "Recent upload (not in database)",
+            "hashes": {
+                "sha256": file_sha256,
+                "tlsh": tlsh_result.get("hash", ""),
+                "ssdeep": ssdeep_result.get("hash", ""),
+            },
+            "similar": similar,
+        }
+    )
 
 
 @app.route("/api/file/<file_sha256>")
@@ -110,7 +563,11 @@ def api_file(file_sha256):
     Get file information by SHA256 hash and calculate similarities.
 
     This endpoint retrieves a file from the database and performs on-the-fly
-    similarity calculations against all other files in the database.
+    similarity calculations against all other files in the database. The
+    serialized response is memoized until a file that would appear in its
+    similar list is added, or the database is reloaded. Files that were
+    recently uploaded to /api/compare without being saved are answered
+    from that comparison instead of a 404.
 
     Args:
         file_sha256 (str): SHA256 hash of the file to retrieve
@@ -126,7 +583,7 @@ def api_file(file_sha256):
 
         Status Codes:
             200: Success
-            404: File not found in database
+            404: File neither in the database nor recently uploaded
 
     Example Response:
         {
@@ -153,74 +610,71 @@ def api_file(file_sha256):
             ]
         }
     """
-    file_entry = database.get(file_sha256)
+    snap = _snapshot
+    file_entry = snap.database.get(file_sha256)
 
     if not file_entry:
+        recent = _recent_upload_response(file_sha256)
+        if recent is not None:
+            return recent
+
         logger.warning(f"File not found: {file_sha256}")
         return jsonify({"error": "File not found"}), 404
 
     logger.info(f"File info requested: {file_sha256}")
 
+    # Serve the memoized response if no relevant file was added since
+    cached = _similar_cache.get(file_sha256)
+    if cached is not None:
+        logger.info(f"Returning cached file info for {file_sha256}")
+        return app.response_class(cached[0], mimetype="application/json")
+
     # Get hashes from database entry
     hashes = file_entry.get("hashes", {})
     tlsh_hash = hashes.get("tlsh")
     ssdeep_hash = hashes.get("ssdeep")
 
-    # Initialize hash manager for comparison
-    hash_manager = HashManager(database, similarity_index)
+    # Worst score in each full top list, used to invalidate the cache later
+    tlsh_cutoff = None
+    ssdeep_cutoff = None
 
-    # Build similar array by comparing against database
-    similar = []
-
-    # Find TLSH matches if hash exists
+    # Find TLSH matches if hash exists (self-match included)
+    tlsh_top = []
     if tlsh_hash:
-        tlsh_matches = hash_manager.find_matches_tlsh(tlsh_hash, top_n=TOP_MATCHES)
-        for match in tlsh_matches["top_matches"]:
-            # Don't skip self-match anymore - include it!
-            similar_entry = {
-                "sha256": match["sha256"],
-                "name": match["name"],
-                "family": match.get("family", "Unknown"),
-                "file_type": match.get("file_type", "Unknown"),
-                "tags": match.get("tags", []),
-                "tlsh_score": max(0, 100 - match["distance"]),
-                "ssdeep_score": 0,
-            }
-            similar.append(similar_entry)
+        tlsh_matches = snap.hash_manager.find_matches_tlsh(tlsh_hash, top_n=TOP_MATCHES)
+        tlsh_top = tlsh_matches["top_matches"]
+        if len(tlsh_top) == TOP_MATCHES:
+            tlsh_cutoff = tlsh_top[-1]["distance"]
 
-    # Find ssdeep matches if hash exists and add/update scores
+    # Find ssdeep matches if hash exists (self-match included)
+    ssdeep_top = []
     if ssdeep_hash:
-        ssdeep_matches = hash_manager.find_matches_ssdeep(
+        ssdeep_matches = snap.hash_manager.find_matches_ssdeep(
             ssdeep_hash, top_n=TOP_MATCHES
         )
-
-        # Create a map for efficient lookup
-        similar_map = {s["sha256"]: s for s in similar}
-
-        for match in ssdeep_matches["top_matches"]:
-            # Don't skip self-match anymore - include it!
-            if match["sha256"] in similar_map:
-                # Update existing entry with ssdeep score
-                similar_map[match["sha256"]]["ssdeep_score"] = match["similarity"]
-            else:
-                # Add new entry
-                similar_entry = {
-                    "sha256": match["sha256"],
-                    "name": match["name"],
-                    "family": match.get("family", "Unknown"),
-                    "file_type": match.get("file_type", "Unknown"),
-                    "tags": match.get("tags", []),
-                    "tlsh_score": 0,
-                    "ssdeep_score": match["similarity"],
-                }
-                similar.append(similar_entry)
-                similar_map[match["sha256"]] = similar_entry
-
-    # Add similar array to response
-    response = {"sha256": file_sha256, **file_entry, "similar": similar}
+        ssdeep_top = ssdeep_matches["top_matches"]
+        if len(ssdeep_top) == TOP_MATCHES:
+            ssdeep_cutoff = ssdeep_top[-1]["similarity"]
+
+    similar = _merge_similar(tlsh_top, ssdeep_top)
+
+    # Add similar array to response (single shallow copy of the entry)
+    response = jsonify(dict(file_entry, sha256=file_sha256, similar=similar))
+
+    # Keep the serialized body, so cache hits skip serialization as well.
+    # Only for the current snapshot: writers publish a new one before they
+    # invalidate under _cache_lock, so a list computed against the old one
+    # and stored after that would never be invalidated.
+    with _cache_lock:
+        if _snapshot is snap:
+            _similar_cache[file_sha256] = (
+                response.get_data(),
+                tlsh_cutoff,
+                ssdeep_cutoff,
+            )
 
     logger.info(f"Returning file info with {len(similar)} similar files")
-    return jsonify(response)
+    return response
 
 
 @app.route("/api/reload", methods=["POST"])
@@ -230,6 +684,8 @@ def reload_database():
 
     This endpoint allows administrators to reload the file database and
     rebuild the similarity index after manual changes to the database file.
+    If the file's mtime and size haven't changed since it was last loaded
+    or written, nothing is re-parsed.
 
     Returns:
         Response: JSON response containing:
@@ -254,14 +710,24 @@ def reload_database():
     """
     try:
         logger.info("Database reload requested")
-        initialize_app()
+        # Let queued writes land first, or the reload would drop them
+        _save_executor.submit(lambda: None).result()
+
+        if _get_db_signature() == _db_signature:
+            logger.info("Database file unchanged, skipping reload")
+            message = "Database unchanged"
+        else:
+            initialize_app()
+            message = "Database reloaded"
+
+        snap = _snapshot
         return jsonify(
             {
                 "status": "success",
-                "message": "Database reloaded",
-                "database_size": len(database),
-                "tlsh_index_size": len(similarity_index.get("tlsh", {})),
-                "ssdeep_index_size": len(similarity_index.get("ssdeep", {})),
+                "message": message,
+                "database_size": len(snap.database),
+                "tlsh_index_size": len(snap.similarity_index.get("tlsh", {})),
+                "ssdeep_index_size": len(snap.similarity_index.get("ssdeep", {})),
             }
         )
     except Exception as e:
@@ -273,8 +739,9 @@ def save_file_to_database(sha256, filename, file_size, file_type, hashes):
     """
     Save a new file to the database.
 
-    Creates a new database entry for the file and persists it to disk.
-    Automatically rebuilds the similarity index to include the new file.
+    Creates a new database entry for the file and schedules a background
+    write to disk, so the caller doesn't wait for the JSON dump. The new
+    file is added incrementally to the similarity index.
 
     Args:
         sha256 (str): SHA256 hash of the file
@@ -288,15 +755,17 @@ def save_file_to_database(sha256, filename, file_size, file_type, hashes):
             - ssdeep (str): ssdeep similarity hash
 
     Returns:
-        bool: True if saved successfully, False if file already exists
+        bool: True if saved (disk write pending), False if file already exists
 
     Global Variables Modified:
-        database (dict): Updated with new file entry
-        similarity_index (dict): Rebuilt to include new file
+        _snapshot (IndexSnapshot): Replaced with a copy that includes the
+                                   new file (the old one is left untouched
+                                   for requests still using it)
 
     Side Effects:
-        - Writes updated database to disk (file_db.json)
-        - Rebuilds similarity index in memory
+        - Schedules an atomic write of the database to disk (file_db.json)
+        - Adds the file's TLSH/ssdeep hashes to the similarity index
+        - Invalidates memoized comparison results affected by the new file
         - Logs operation status
 
     Example:
@@ -310,48 +779,55 @@ def save_file_to_database(sha256, filename, file_size, file_type, hashes):
         ...                       "application/x-dosexec", hashes)
         True
     """
-    global database, similarity_index
-
-    # Check if already exists
-    if sha256 in database:
-        logger.info(f"File already in database: {sha256}")
-        return False
-
-    # Create new entry
-    now_iso = datetime.utcnow().isoformat() + "Z"
-
-    database[sha256] = {
-        "name": [filename],
-        "size": file_size,
-        "file_type": file_type,
-        "first_upload_date": now_iso,
-        "last_upload_date": now_iso,
-        "desc": "",
-        "hashes": {
-            "sha256": hashes.get("sha256", sha256),
-            "md5": hashes.get("md5", ""),
-            "tlsh": hashes.get("tlsh", ""),
-            "ssdeep": hashes.get("ssdeep", ""),
-        },
-    }
+    global _snapshot
 
-    # Save to disk
-    try:
-        save_db(database, DB_PATH)
-        logger.info(f"File saved to database: {sha256} ({filename})")
+    with _write_lock:
+        snap = _snapshot
+
+        # Check if already exists
+        if sha256 in snap.database:
+            logger.info(f"File already in database: {sha256}")
+            return False
+
+        # Create new entry
+        now_iso = _iso_now()
 
-        # Rebuild similarity index to include new file
-        similarity_index = build_similarity_index(database)
+        entry = {
+            "name": [filename],
+            "size": file_size,
+            "file_type": file_type,
+            "first_upload_date": now_iso,
+            "last_upload_date": now_iso,
+            "desc": "",
+            "hashes": {
+                "sha256": hashes.get("sha256", sha256),
+                "md5": hashes.get("md5", ""),
+                "tlsh": hashes.get("tlsh", ""),
+                "ssdeep": hashes.get("ssdeep", ""),
+            },
+        }
+
+        # Build the new snapshot from copies (no full index rebuild)
+        database = dict(snap.database)
+        database[sha256] = entry
+        similarity_index = copy_similarity_index(snap.similarity_index)
+        add_to_similarity_index(similarity_index, sha256, entry["hashes"])
         logger.info(
-            f"Similarity index rebuilt: {len(similarity_index['tlsh'])} TLSH, {len(similarity_index['ssdeep'])} ssdeep"
+            f"Similarity index updated: {len(similarity_index['tlsh'])} TLSH, {len(similarity_index['ssdeep'])} ssdeep"
         )
+        _snapshot = IndexSnapshot(database, similarity_index)
 
-        return True
-    except Exception as e:
-        logger.error(f"Error saving file to database: {e}")
-        # Rollback - remove from in-memory database
-        del database[sha256]
-        return False
+        # Save to disk in the background so the request doesn't wait for it
+        # (write errors are reported by /api/health, see _flush_db)
+        _schedule_save()
+        logger.info(f"File saved to database: {sha256} ({filename})")
+
+        # Cached matches don't know about the new file
+        with _cache_lock:
+            _compare_cache.clear()
+        _invalidate_similar_cache(_snapshot, entry["hashes"])
+
+    return True
 
 
 @app.route("/api/compare", methods=["POST"])
@@ -367,6 +843,10 @@ def compare_binary():
         save_to_db (str): "true" to save the file to database, "false" otherwise
                          (optional, default: "false")
 
+    Query Parameters:
+        md5 (str): "1" to include the MD5 of the file in the response
+                   (optional, default: "0"; always calculated when saving)
+
     Returns:
         Response: JSON response containing:
             - uploaded_file (dict): Information about the uploaded file
@@ -376,7 +856,8 @@ def compare_binary():
                 - sha256 (str): SHA256 hash
                 - exists_in_database (bool): Whether file exists in DB
                 - saved_to_database (bool): Whether file was saved to DB
-                - hashes (dict): All calculated hashes
+                - hashes (dict): All calculated hashes (md5 is None unless
+                                 requested or saved)
             - tlsh (dict): TLSH comparison results
                 - best_match (dict): Best matching file
                 - similarity_score (int): Distance to best match
@@ -391,12 +872,15 @@ def compare_binary():
 
     Processing Steps:
         1. Validates file upload
-        2. Calculates SHA256 and MD5 on raw data
+        2. Calculates SHA256 on raw data while reading the upload
         3. Processes file content (extracts text from PDFs/DOCX if applicable)
         4. Calculates TLSH and ssdeep on processed content
         5. Finds similar files in database
         6. Optionally saves new file to database
 
+        Steps 3-5 are skipped when the same bytes were analysed recently and
+        the database hasn't changed since (see COMPARE_CACHE_SIZE).
+
     Example Request:
         POST /api/compare
         Content-Type: multipart/form-data
@@ -449,16 +933,17 @@ def compare_binary():
 
     # Check if we should save the file to database (optional parameter)
     save_to_db = request.form.get("save_to_db", "false").lower() == "true"
+    compute_md5 = request.args.get("md5", "0") == "1"
 
-    file_data = file.read()
-    file_size = len(file_data)
+    # 1. Read the upload and calculate SHA256 on RAW data
+    file_data, file_size, sha256_hash = _read_upload(file)
 
     logger.info(
         f"File upload: {file.filename} ({file_size} bytes, save_to_db={save_to_db})"
     )
 
     # Validar tamaño del archivo
-    if file_size > MAX_FILE_SIZE:
+    if file_data is None:
         logger.warning(f"File too large: {file.filename} ({file_size} bytes)")
         return (
             jsonify(
@@ -473,58 +958,84 @@ def compare_binary():
             413,
         )
 
-    # 1. Calculate traditional hashes on RAW data
-    sha256_hash = hashlib.sha256(file_data).hexdigest()
-    md5_hash = hashlib.md5(file_data).hexdigest()
-
-    logger.info(f"Hashes calculated - SHA256: {sha256_hash}, MD5: {md5_hash}")
-
-    # Check if file already exists in database
-    existing_file = database.get(sha256_hash)
-
-    # 2. Procesar archivo según tipo
-    processor = FileProcessor(file_data, file.filename)
-    file_type = processor.get_file_type()
-    logger.info(f"File type detected: {file_type}")
-
-    success, file_content = processor.process()
+    logger.info(f"Hash calculated - SHA256: {sha256_hash}")
+
+    # One snapshot for the whole request, so the matches and the
+    # exists_in_database flag describe the same database
+    snap = _snapshot
+
+    # Reuse the analysis if these exact bytes were uploaded recently
+    with _cache_lock:
+        cached = _compare_cache.get(sha256_hash)
+        if cached is not None:
+            _compare_cache.move_to_end(sha256_hash)
+
+    if cached is not None:
+        _, file_type, _, result = cached
+        logger.info(f"Upload cache hit - SHA256: {sha256_hash}")
+    else:
+        # 2. Procesar archivo según tipo
+        processor = FileProcessor(file_data, file.filename)
+        file_type = processor.get_file_type()
+        logger.info(f"File type detected: {file_type}")
+
+        success, file_content = processor.process()
+
+        if not success:
+            logger.error(f"File processing failed: {file.filename} - {file_content}")
+            return (
+                jsonify(
+                    {
+                        "error": "File processing failed",
+                        "filename": file.filename,
+                        "detected_type": file_type,
+                        "details": file_content,
+                    }
+                ),
+                400,
+            )
 
-    if not success:
-        logger.error(f"File processing failed: {file.filename} - {file_content}")
-        return (
-            jsonify(
-                {
-                    "error": "File processing failed",
-                    "filename": file.filename,
-                    "detected_type": file_type,
-                    "details": file_content,
-                }
-            ),
-            400,
+        # 3. Calcular similarity hashes (TLSH + ssdeep) on PROCESSED content
+        success, result = snap.hash_manager.compare_file(
+            file_content, top_n=TOP_MATCHES, use_ssdeep=True
         )
 
-    # 3. Calcular similarity hashes (TLSH + ssdeep) on PROCESSED content
-    hash_manager = HashManager(database, similarity_index)
-    success, result = hash_manager.compare_file(
-        file_content, top_n=TOP_MATCHES, use_ssdeep=True
-    )
+        if not success:
+            logger.error(f"Hash calculation failed: {file.filename} - {result}")
+            return (
+                jsonify(
+                    {
+                        "error": "Hash calculation failed",
+                        "filename": file.filename,
+                        "file_type": file_type,
+                        "details": result,
+                    }
+                ),
+                400,
+            )
 
-    if not success:
-        logger.error(f"Hash calculation failed: {file.filename} - {result}")
-        return (
-            jsonify(
-                {
-                    "error": "Hash calculation failed",
-                    "filename": file.filename,
-                    "file_type": file_type,
-                    "details": result,
-                }
-            ),
-            400,
+        logger.info(
+            f"Similarity hashes calculated - TLSH: {result['tlsh'].get('hash', 'N/A')[:16]}..., ssdeep: {result['ssdeep'].get('hash', 'N/A')[:16]}..."
         )
 
-    logger.info(
-        f"Similarity hashes calculated - TLSH: {result['tlsh'].get('hash', 'N/A')[:16]}..., ssdeep: {result['ssdeep'].get('hash', 'N/A')[:16]}..."
+        # Only remember matches of the current snapshot: an insert that
+        # landed meanwhile has already cleared the cache, and storing them
+        # now would bring back results that miss the new file
+        with _cache_lock:
+            if _snapshot is snap:
+                _compare_cache[sha256_hash] = (
+                    file.filename,
+                    file_type,
+                    file_size,
+                    result,
+                )
+                if len(_compare_cache) > COMPARE_CACHE_SIZE:
+                    _compare_cache.popitem(last=False)
+
+    # Check if file already exists in database
+    exists_in_database = sha256_hash in snap.database
+    md5_hash = _md5_if_needed(
+        file_data, compute_md5, save_to_db and not exists_in_database
     )
 
     # Prepare all hashes
@@ -537,7 +1048,7 @@ def compare_binary():
 
     # 4. Save to database if requested and not already exists
     saved_to_db = False
-    if save_to_db and not existing_file:
+    if save_to_db and not exists_in_database:
         saved_to_db = save_file_to_database(
             sha256_hash, file.filename, file_size, file_type, all_hashes
         )
@@ -549,7 +1060,7 @@ def compare_binary():
             "file_type": file_type,
             "content_size_bytes": result["content_size"],
             "sha256": sha256_hash,
-            "exists_in_database": existing_file is not None or saved_to_db,
+            "exists_in_database": exists_in_database or saved_to_db,
             "saved_to_database": saved_to_db,
             "hashes": all_hashes,
         },
@@ -607,7 +1118,10 @@ def health():
 
     Returns:
         Response: JSON response containing:
-            - status (str): "ok" if system is healthy
+            - status (str): "ok" if system is healthy, "degraded" if the
+                            last background database write failed
+            - last_save_error (str): Why that write failed (only when
+                                     degraded)
             - database_size (int): Number of files in database
             - tlsh_index_size (int): Number of TLSH hashes indexed
             - ssdeep_index_size (int): Number of ssdeep hashes indexed
@@ -625,16 +1139,25 @@ def health():
             "version": "1.0.0"
         }
     """
-    return jsonify(
-        {
-            "status": "ok",
-            "database_size": len(database),
-            "tlsh_index_size": len(similarity_index.get("tlsh", {})),
-            "ssdeep_index_size": len(similarity_index.get("ssdeep", {})),
-            "version": "1.0.0",
-        }
-    )
+    snap = _snapshot
+    save_error = _save_error
+    status = {
+        "status": "ok" if save_error is None else "degraded",
+        "database_size": len(snap.database),
+        "tlsh_index_size": len(snap.similarity_index.get("tlsh", {})),
+        "ssdeep_index_size": len(snap.similarity_index.get("ssdeep", {})),
+        "version": "1.0.0",
+    }
+    if save_error is not None:
+        status["last_save_error"] = save_error
+    return jsonify(status)
 
 
 if __name__ == "__main__":
-    app.run(debug=True, host="0.0.0.0", port=5000)
+    # Werkzeug's debug server only with FLASK_DEBUG=1 (or without waitress)
+    debug = os.environ.get("FLASK_DEBUG", "") not in ("", "0")
+    if debug or serve is None:
+        app.run(debug=debug, host="0.0.0.0", port=5000)
+    else:
+        logger.info(f"Serving with waitress on 0.0.0.0:5000 ({WSGI_THREADS} threads)")
+        serve(app, host="0.0.0.0", port=5000, threads=WSGI_THREADS)
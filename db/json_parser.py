@@ -9,10 +9,17 @@ The database stores file metadata, traditional hashes (SHA256, MD5), and similar
 hashes for efficient file correlation and variant detection.
 
 Main Functions:
-    - load_db: Load database from disk
+    - load_db: Load database from disk (base file plus pending delta)
     - save_db: Save database to disk
+    - append_delta: Append new/updated entries to the delta log
+    - compact_db: Fold the delta log back into the base file
     - update_db_with_file: Add or update a file in the database
+    - compute_meta_unless_known: Skip re-hashing files already in the database
     - build_similarity_index: Create fast lookup index for similarity searches
+    - add_to_similarity_index: Add a single file to an existing index
+    - copy_similarity_index: Copy an index before extending it
+    - load_index_cache: Load a pickled database and index, if still valid
+    - save_index_cache: Pickle the database and index for the next start
     - main: CLI entry point for batch processing
 
 Database Structure:
@@ -33,16 +40,31 @@ Database Structure:
         }
     }
 
+Delta Log:
+    Runs of the CLI don't rewrite the whole database. New and updated
+    entries are appended to db/file_db.delta.jsonl, one {sha256: entry}
+    object per line, and load_db() applies them over file_db.json in order.
+    compact_db() (--compact) writes everything back to file_db.json and
+    removes the log.
+
 Usage:
     # Process files in a directory
     python3 db/json_parser.py /path/to/files/
 
-    # Process specific files
-    python3 db/json_parser.py file1.exe file2.pdf
+    # Process specific files, logging each one
+    python3 db/json_parser.py -v file1.exe file2.pdf
+
+    # Fold the delta log into file_db.json
+    python3 db/json_parser.py --compact
+
+    # Rebuild the similarity index from scratch instead of updating it
+    python3 db/json_parser.py --rebuild-index /path/to/files/
 
 Dependencies:
     - tlsh: Trend Micro Locality Sensitive Hash (optional)
     - ssdeep: Context-triggered piecewise hashing (optional)
+    - orjson: Fast JSON serialization (optional)
+    - numpy: Decoded TLSH matrix in the similarity index
     - FileProcessor: From managers.file_processor
 
 Authors:
@@ -57,12 +79,25 @@ Date: December 2025
 import sys
 import os
 import json
+import mmap
+import pickle
+import stat
+import functools
 import hashlib
-from datetime import datetime
+import io
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
 
 # Import FileProcessor for consistent file handling
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from managers.file_processor import FileProcessor
+from managers.ssdeep_digest import split_ssdeep
+from managers.tlsh_matrix import TLSH_DIGEST_LENGTHS, decode_tlsh, decode_tlsh_batch
+import numpy as np
+
+# Per-file progress goes through logging: quiet by default, shown with -v
+logger = logging.getLogger(__name__)
 
 # Optional external libraries
 try:
@@ -77,18 +112,46 @@ except ImportError:
     ssdeep = None
     print("[WARN] ssdeep library not found. ssdeep hashing will be disabled.")
 
+# Optional fast JSON serializer (falls back to the stdlib json module)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 DB_PATH = "db/file_db.json"
+INDEX_CACHE_PATH = "db/file_db.cache.pkl"
+# Bump whenever build_similarity_index() changes the layout of the index,
+# so caches pickled by older code are rebuilt instead of loaded
+INDEX_CACHE_VERSION = 1
+STAT_CACHE_PATH = "db/stat_cache.json"  # {abs_path: [size, mtime_ns, sha256]}
+HASH_CHUNK_SIZE = 256 * 1024  # Read/hash files in 256KB chunks
 
 
 # -----------------------------
 # Helpers: load/save DB
 # -----------------------------
+def delta_path(path: str = DB_PATH) -> str:
+    """
+    Get the path of the delta log that belongs to a database file.
+
+    Args:
+        path (str): Path to the JSON database file (default: db/file_db.json)
+
+    Returns:
+        str: Path to the delta log, e.g. "db/file_db.delta.jsonl"
+    """
+    return os.path.splitext(path)[0] + ".delta.jsonl"
+
+
 def load_db(path: str = DB_PATH) -> dict:
     """
     Load the JSON database from disk.
 
     Reads the file database from the specified path and returns it as a
     Python dictionary. If the file doesn't exist, returns an empty dictionary.
+    When orjson is available the file is memory-mapped and parsed straight
+    from the mapping, skipping the read into an intermediate str. Entries
+    from the delta log (see append_delta) are applied on top.
 
     Args:
         path (str): Path to the JSON database file (default: db/file_db.json)
@@ -105,22 +168,148 @@ def load_db(path: str = DB_PATH) -> dict:
         >>> print(f"Database has {len(db)} entries")
         Database has 150 entries
     """
+    db = _load_base(path)
+    _replay_delta(db, delta_path(path))
+    return db
+
+
+def _load_base(path: str) -> dict:
+    """
+    Load the base JSON file of the database, without the delta log.
+
+    Args:
+        path (str): Path to the JSON database file
+
+    Returns:
+        dict: Database contents, {} if the file doesn't exist
+    """
     if not os.path.exists(path):
         return {}
+
+    if orjson is not None and os.path.getsize(path) > 0:
+        with open(path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                with memoryview(mm) as buf:
+                    return orjson.loads(buf)
+
     with open(path, "r", encoding="utf-8") as f:
         return json.load(f)
 
 
-def save_db(db: dict, path: str = DB_PATH) -> None:
+def _replay_delta(db: dict, path: str) -> None:
+    """
+    Apply the entries of a delta log to a database, in order.
+
+    Every line holds complete entries, so later lines simply replace
+    earlier versions. A truncated last line (interrupted append) is
+    skipped with a warning.
+
+    Args:
+        db (dict): Database to update (modified in-place)
+        path (str): Path to the delta log
+    """
+    if not os.path.exists(path):
+        return
+
+    loads = orjson.loads if orjson is not None else json.loads
+    with open(path, "rb") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                db.update(loads(line))
+            except ValueError as e:
+                logger.warning(f"Skipping invalid delta line {line_no} in {path}: {e}")
+
+
+def append_delta(entries: dict, path: str = DB_PATH) -> None:
+    """
+    Append new or updated entries to the delta log of a database.
+
+    Only the given entries are written, so adding one file costs one short
+    line instead of rewriting the whole database. Each entry gets its own
+    line, in the order of entries, so replaying the log adds new entries
+    to the database in the same order as they were created.
+
+    Args:
+        entries (dict): {sha256: entry} to persist, in insertion order
+        path (str): Path to the JSON database file (default: db/file_db.json)
+
+    Example:
+        >>> append_delta({sha256: db[sha256]})
+    """
+    if not entries:
+        return
+
+    if orjson is not None:
+        lines = [
+            orjson.dumps({sha256: entry}, option=orjson.OPT_SORT_KEYS) + b"\n"
+            for sha256, entry in entries.items()
+        ]
+    else:
+        lines = [
+            (json.dumps({sha256: entry}, sort_keys=True) + "\n").encode("utf-8")
+            for sha256, entry in entries.items()
+        ]
+
+    with open(delta_path(path), "ab") as f:
+        f.write(b"".join(lines))
+
+
+def clear_delta(path: str = DB_PATH) -> None:
+    """
+    Remove the delta log once the base file contains all its entries.
+
+    Args:
+        path (str): Path to the JSON database file (default: db/file_db.json)
+    """
+    try:
+        os.remove(delta_path(path))
+    except FileNotFoundError:
+        pass
+
+
+def compact_db(path: str = DB_PATH) -> dict:
+    """
+    Fold the delta log into the base JSON file.
+
+    The merged database replaces the base file (atomically, see save_db)
+    before the log is removed, so an interruption at any point leaves a
+    database that still loads the same entries.
+
+    Args:
+        path (str): Path to the JSON database file (default: db/file_db.json)
+
+    Returns:
+        dict: The compacted database
+
+    Example:
+        >>> db = compact_db()
+    """
+    db = load_db(path)
+    save_db(db, path)
+    clear_delta(path)
+    return db
+
+
+def save_db(db: dict, path: str = DB_PATH, pretty: bool = True) -> None:
     """
     Save the JSON database to disk.
 
     Writes the database dictionary to disk as formatted JSON with indentation
-    and sorted keys for better readability and version control.
+    and sorted keys for better readability and version control. The file
+    ends with a newline. The JSON is written to a temporary file next to the
+    target, which then replaces it, so a crash mid-write never leaves a
+    truncated database behind.
+
+    Files nobody reads by hand (like the CLI stat cache) can skip the
+    indentation with pretty=False; those are written with orjson when it is
+    available. Keys are sorted either way, so the load order is the same.
 
     Args:
         db (dict): Database dictionary to save
         path (str): Destination path for the JSON file (default: db/file_db.json)
+        pretty (bool): Indent the output (default: True)
 
     Returns:
         None
@@ -137,8 +326,30 @@ def save_db(db: dict, path: str = DB_PATH) -> None:
         >>> save_db(db, "db/file_db.json")
         # File is written to disk
     """
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(db, f, indent=4, sort_keys=True)
+    # Per-process name, so concurrent writers don't share a temporary file
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    try:
+        if pretty:
+            # Always the stdlib layout of db/file_db.json (4-space indent), so
+            # a save only touches the lines of the entries that changed.
+            # Sorted keys keep diffs stable and the load order (and the
+            # similarity index row order) deterministic.
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(db, f, indent=4, sort_keys=True)
+                f.write("\n")
+        elif orjson is not None:
+            with open(tmp_path, "wb") as f:
+                options = orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE
+                f.write(orjson.dumps(db, option=options))
+        else:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(db, f, separators=(",", ":"), sort_keys=True)
+                f.write("\n")
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
 
 # -----------------------------
@@ -172,16 +383,42 @@ def lookup_by_sha256(db: dict, sha256_value: str):
 # -----------------------------
 # Hashing + file metadata
 # -----------------------------
+def _read_and_hash(file_path: str):
+    """
+    Read a file while calculating its SHA256 and MD5 in the same pass.
+
+    The file is read in HASH_CHUNK_SIZE chunks and each chunk feeds both
+    hashers while it is still in cache, instead of hashing the whole
+    buffer twice.
+
+    Args:
+        file_path (str): Path to the file to read
+
+    Returns:
+        tuple: (raw_data, sha256_hex, md5_hex)
+    """
+    sha256 = hashlib.sha256()
+    md5 = hashlib.md5()
+    buf = io.BytesIO()
+
+    with open(file_path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            buf.write(chunk)
+            sha256.update(chunk)
+            md5.update(chunk)
+
+    return buf.getvalue(), sha256.hexdigest(), md5.hexdigest()
+
+
 def compute_hashes_and_meta(file_path: str) -> dict:
     """
     Compute all hashes and metadata for a file.
 
     This function performs comprehensive file analysis:
-    1. Reads the raw file data
+    1. Reads the raw file data, calculating traditional hashes (SHA256, MD5)
     2. Detects file type using FileProcessor
     3. Processes content (extracts text from PDFs/DOCX, uses raw for binaries)
-    4. Calculates traditional hashes (SHA256, MD5) on raw data
-    5. Calculates similarity hashes (TLSH, ssdeep) on processed content
+    4. Calculates similarity hashes (TLSH, ssdeep) on processed content
 
     The dual-hashing approach ensures:
     - Traditional hashes identify exact file matches
@@ -216,8 +453,8 @@ def compute_hashes_and_meta(file_path: str) -> dict:
         >>> print(f"TLSH: {meta['tlsh']}")
         >>> print(f"File type: {meta['file_type']}")
     """
-    with open(file_path, "rb") as f:
-        raw_data = f.read()
+    # Calculate traditional hashes on RAW data while reading it
+    raw_data, sha256, md5 = _read_and_hash(file_path)
 
     # Use FileProcessor to process the file
     processor = FileProcessor(raw_data, os.path.basename(file_path))
@@ -227,21 +464,17 @@ def compute_hashes_and_meta(file_path: str) -> dict:
     success, processed_content = processor.process()
 
     if not success:
-        print(f"[WARN] Failed to process {file_path}: {processed_content}")
+        logger.warning(f"Failed to process {file_path}: {processed_content}")
         # Fall back to raw data if processing fails
         processed_content = raw_data
 
-    # Calculate traditional hashes on RAW data
-    sha256 = hashlib.sha256(raw_data).hexdigest()
-    md5 = hashlib.md5(raw_data).hexdigest()
-
     # Calculate similarity hashes on PROCESSED content
     # TLSH
     if tlsh is not None and len(processed_content) >= 50:
         try:
             tlsh_hash = tlsh.hash(processed_content)
         except Exception as e:
-            print(f"[WARN] TLSH calculation failed for {file_path}: {e}")
+            logger.warning(f"TLSH calculation failed for {file_path}: {e}")
             tlsh_hash = ""
     else:
         tlsh_hash = ""
@@ -251,7 +484,7 @@ def compute_hashes_and_meta(file_path: str) -> dict:
         try:
             ssdeep_hash = ssdeep.hash(processed_content)
         except Exception as e:
-            print(f"[WARN] ssdeep calculation failed for {file_path}: {e}")
+            logger.warning(f"ssdeep calculation failed for {file_path}: {e}")
             ssdeep_hash = ""
     else:
         ssdeep_hash = ""
@@ -269,10 +502,129 @@ def compute_hashes_and_meta(file_path: str) -> dict:
     }
 
 
+def _sha256_of_file(file_path: str) -> str:
+    """
+    Calculate the SHA256 of a file without keeping its content.
+
+    Args:
+        file_path (str): Path to the file to hash
+
+    Returns:
+        str: SHA256 hex digest
+    """
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def compute_meta_unless_known(
+    file_path: str, known_sizes: frozenset, known_sha256: frozenset
+) -> dict:
+    """
+    Compute hashes and metadata, skipping most work for known files.
+
+    Re-running the CLI over an already indexed directory would otherwise
+    process and TLSH/ssdeep-hash every file again only to find its SHA256
+    in the database. The size is free to check (one stat), so only files
+    whose size matches some entry get a plain SHA256 pass first; when that
+    SHA256 is already known, nothing else is calculated.
+
+    Args:
+        file_path (str): Path to the file to analyze
+        known_sizes (frozenset): Sizes of the files in the database
+        known_sha256 (frozenset): SHA256 hashes in the database
+
+    Returns:
+        dict: compute_hashes_and_meta() result, or just {"sha256": str}
+              for a file that is already in the database
+
+    Example:
+        >>> sizes = frozenset(entry.get("size") for entry in db.values())
+        >>> meta = compute_meta_unless_known("a.exe", sizes, frozenset(db))
+    """
+    if os.path.getsize(file_path) in known_sizes:
+        sha256 = _sha256_of_file(file_path)
+        if sha256 in known_sha256:
+            return {"sha256": sha256}
+
+    return compute_hashes_and_meta(file_path)
+
+
+def _file_stamp(file_path: str):
+    """
+    Get the key and stat stamp of a file for the CLI's stat cache.
+
+    Args:
+        file_path (str): Path to the file
+
+    Returns:
+        tuple | None: (abs_path, [size, mtime_ns]), None if it can't be
+                      stat'ed (the error surfaces when it's processed)
+    """
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None
+    return os.path.abspath(file_path), [st.st_size, st.st_mtime_ns]
+
+
+# Database contents each CLI worker process compares files against, sent
+# once per process by _init_worker() instead of once per file
+_worker_known_sizes = frozenset()
+_worker_known_sha256 = frozenset()
+
+
+def _init_worker(known_sizes: frozenset, known_sha256: frozenset) -> None:
+    """
+    Store what compute_meta_unless_known() needs in a worker process.
+
+    Args:
+        known_sizes (frozenset): Sizes of the files in the database
+        known_sha256 (frozenset): SHA256 hashes in the database
+    """
+    global _worker_known_sizes, _worker_known_sha256
+
+    _worker_known_sizes = known_sizes
+    _worker_known_sha256 = known_sha256
+
+
+def _compute_meta_in_worker(file_path: str) -> dict:
+    """
+    Run compute_meta_unless_known() inside a worker process.
+
+    Args:
+        file_path (str): Path to the file to analyze
+
+    Returns:
+        dict: Metadata, see compute_meta_unless_known()
+    """
+    return compute_meta_unless_known(
+        file_path, _worker_known_sizes, _worker_known_sha256
+    )
+
+
 # -----------------------------
 # Update DB with a file
 # -----------------------------
-def update_db_with_file(file_path: str, db: dict) -> None:
+def _utc_timestamp() -> str:
+    """
+    Get the current UTC time in the format used for upload dates.
+
+    Returns:
+        str: Timestamp such as "2025-12-03T16:36:04.710093Z"
+    """
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def update_db_with_file(
+    file_path: str,
+    db: dict,
+    meta: dict = None,
+    name_sets: dict = None,
+    now_iso: str = None,
+):
     """
     Add a file to the database or update if it already exists.
 
@@ -288,9 +640,20 @@ def update_db_with_file(file_path: str, db: dict) -> None:
     Args:
         file_path (str): Path to the file to add/update
         db (dict): Database dictionary to modify (modified in-place)
+        meta (dict | None): Result of compute_hashes_and_meta() if it was
+                            already calculated (e.g. by a worker thread).
+                            For files already in db only "sha256" is used,
+                            see compute_meta_unless_known()
+        name_sets (dict | None): {sha256: set of names} kept by the caller
+                                 across calls, so checking whether a name is
+                                 already listed doesn't scan the list. Only
+                                 lives in memory, entries keep plain lists
+        now_iso (str | None): Upload timestamp to record, shared by a whole
+                              batch (default: current UTC time)
 
     Returns:
-        None (modifies db in-place)
+        str | None: SHA256 of the entry that was created or updated (db is
+                    modified in-place), None if the file was skipped
 
     Side Effects:
         - Modifies the db dictionary
@@ -312,19 +675,21 @@ def update_db_with_file(file_path: str, db: dict) -> None:
         >>> save_db(db)
     """
     if not os.path.isfile(file_path):
-        print(f"[WARN] Skipping (not a file): {file_path}")
-        return
+        logger.warning(f"Skipping (not a file): {file_path}")
+        return None
 
-    print(f"[INFO] Processing: {file_path}")
+    logger.info(f"Processing: {file_path}")
 
-    try:
-        meta = compute_hashes_and_meta(file_path)
-    except Exception as e:
-        print(f"[ERROR] Failed to process {file_path}: {e}")
-        return
+    if meta is None:
+        try:
+            meta = compute_hashes_and_meta(file_path)
+        except Exception as e:
+            logger.error(f"Failed to process {file_path}: {e}")
+            return None
 
     sha256 = meta["sha256"]
-    now_iso = datetime.utcnow().isoformat() + "Z"
+    if now_iso is None:
+        now_iso = _utc_timestamp()
     base_name = os.path.basename(file_path)
 
     existing_entry = lookup_by_sha256(db, sha256)
@@ -334,23 +699,32 @@ def update_db_with_file(file_path: str, db: dict) -> None:
         if "name" not in existing_entry or not isinstance(existing_entry["name"], list):
             existing_entry["name"] = []
 
-        if base_name not in existing_entry["name"]:
+        if name_sets is None:
+            known_names = existing_entry["name"]
+        else:
+            known_names = name_sets.get(sha256)
+            if known_names is None:
+                known_names = name_sets[sha256] = set(existing_entry["name"])
+
+        if base_name not in known_names:
+            if name_sets is not None:
+                known_names.add(base_name)
             existing_entry["name"].append(base_name)
-            print(
-                f"[INFO] Updated existing entry: {sha256[:16]}... (added name: {base_name})"
+            logger.info(
+                f"Updated existing entry: {sha256[:16]}... (added name: {base_name})"
             )
 
         existing_entry["last_upload_date"] = now_iso
-        return
+        return sha256
 
     # New entry
-    print(f"[INFO] Creating new entry: {sha256[:16]}... ({base_name})")
-    print(f"       Type: {meta['file_type']}")
-    print(
-        f"       Size: {meta['size']} bytes (processed: {meta['processed_size']} bytes)"
+    logger.info(
+        f"Creating new entry: {sha256[:16]}... ({base_name})\n"
+        f"       Type: {meta['file_type']}\n"
+        f"       Size: {meta['size']} bytes (processed: {meta['processed_size']} bytes)\n"
+        f"       TLSH: {meta['tlsh'][:32] if meta['tlsh'] else 'N/A'}...\n"
+        f"       ssdeep: {meta['ssdeep'][:32] if meta['ssdeep'] else 'N/A'}..."
     )
-    print(f"       TLSH: {meta['tlsh'][:32] if meta['tlsh'] else 'N/A'}...")
-    print(f"       ssdeep: {meta['ssdeep'][:32] if meta['ssdeep'] else 'N/A'}...")
 
     db[sha256] = {
         "name": [base_name],
@@ -366,6 +740,7 @@ def update_db_with_file(file_path: str, db: dict) -> None:
             "ssdeep": meta["ssdeep"],
         },
     }
+    return sha256
 
 
 # -----------------------------
@@ -386,22 +761,44 @@ def build_similarity_index(db: dict) -> dict:
         dict: Similarity index with structure:
             {
                 "tlsh": {
-                    "tlsh_hash_1": "sha256_1",
-                    "tlsh_hash_2": "sha256_2",
+                    "tlsh_hash_1": ["sha256_1"],
+                    "tlsh_hash_2": ["sha256_2", "sha256_3"],
                     ...
                 },
                 "ssdeep": {
-                    "ssdeep_hash_1": "sha256_1",
-                    "ssdeep_hash_2": "sha256_2",
+                    "ssdeep_hash_1": ["sha256_1"],
+                    "ssdeep_hash_2": ["sha256_2"],
+                    ...
+                },
+                "ssdeep_bs": {
+                    block_size_1: {"ssdeep_hash_1": ["sha256_1"], ...},
+                    ...
+                },
+                "ssdeep_parts": {
+                    "ssdeep_hash_1": split_ssdeep("ssdeep_hash_1"),
                     ...
-                }
+                },
+                "tlsh_mat": np.ndarray of shape (N, 35), one decoded
+                            TLSH digest per row,
+                "tlsh_ids": ["sha256_1", "sha256_2", ...],  # one per row
+                "tlsh_rows": {"tlsh_hash_1": 0, ...}  # tlsh_mat row of a hash
             }
 
     Notes:
-        - If multiple files share the same similarity hash, only the last
-          one is kept in the index (hash collision)
+        - Files sharing the same similarity hash (e.g. documents with the
+          same extracted text) are all kept under that hash
         - Empty hashes are skipped
         - Files without similarity hashes won't appear in the index
+        - "ssdeep_bs" groups ssdeep hashes by block size, since ssdeep can
+          only match digests whose block sizes are equal or differ by 2x
+        - "ssdeep_parts" keeps each ssdeep digest pre-split (chunks and
+          7-grams) so searches can skip pairs that always score 0
+        - "tlsh_mat"/"tlsh_ids" store every valid TLSH digest as one
+          contiguous uint8 matrix plus the SHA256 of each row, so TLSH
+          searches scan a single array (rows follow database order)
+        - "tlsh_rows" finds the already decoded row of a known TLSH hash,
+          so searching for a file of the database never decodes its hash
+        - Use add_to_similarity_index to add single files afterwards
 
     Performance:
         - Time: O(n) where n is number of files in database
@@ -418,27 +815,211 @@ def build_similarity_index(db: dict) -> dict:
     result = {
         "tlsh": {},
         "ssdeep": {},
+        "ssdeep_bs": {},
+        "ssdeep_parts": {},
+        "tlsh_ids": [],
+        "tlsh_rows": {},
     }
 
+    tlsh_ids = []
+    tlsh_digests = []
     for sha256, entry in db.items():
-        hashes = entry.get("hashes", {})
-        tlsh_val = hashes.get("tlsh", "")
-        ssdeep_val = hashes.get("ssdeep", "")
+        tlsh_digest = _index_hashes(result, sha256, entry.get("hashes", {}))
+        if tlsh_digest is not None:
+            tlsh_ids.append(sha256)
+            tlsh_digests.append(tlsh_digest)
 
-        if tlsh_val:
-            result["tlsh"][tlsh_val] = sha256
-        if ssdeep_val:
-            result["ssdeep"][ssdeep_val] = sha256
+    # Decode every TLSH digest with a single hex decode
+    try:
+        result["tlsh_mat"] = decode_tlsh_batch(tlsh_digests)
+    except ValueError:
+        # Some digest isn't hex: decode one by one to leave it out
+        rows = []
+        valid = []
+        for sha256, tlsh_digest in zip(tlsh_ids, tlsh_digests):
+            try:
+                rows.append(decode_tlsh(tlsh_digest))
+                valid.append((sha256, tlsh_digest))
+            except ValueError as e:
+                logger.warning(f"Invalid TLSH hash for {sha256}: {e}")
+        tlsh_ids = [sha256 for sha256, _ in valid]
+        tlsh_digests = [tlsh_digest for _, tlsh_digest in valid]
+        result["tlsh_mat"] = decode_tlsh_batch(tlsh_digests)
+
+    result["tlsh_ids"] = tlsh_ids
+    for row, tlsh_digest in enumerate(tlsh_digests):
+        result["tlsh_rows"].setdefault(tlsh_digest, row)
 
     return result
 
 
+def copy_similarity_index(similarity_index: dict) -> dict:
+    """
+    Copy a similarity index so the copy can be extended independently.
+
+    Only the containers that add_to_similarity_index modifies are copied;
+    the sha256 lists are shared, since they are replaced instead of being
+    appended to, and the TLSH matrix is replaced on every insert as well.
+
+    Args:
+        similarity_index (dict): Index built by build_similarity_index
+
+    Returns:
+        dict: New index with the same contents
+
+    Performance:
+        - Time: O(h) where h is number of unique hashes (shallow copies)
+
+    Example:
+        >>> new_index = copy_similarity_index(index)
+        >>> add_to_similarity_index(new_index, "abc123...", hashes)
+        >>> # index is unchanged
+    """
+    return {
+        "tlsh": dict(similarity_index["tlsh"]),
+        "ssdeep": dict(similarity_index["ssdeep"]),
+        "ssdeep_bs": {
+            block_size: dict(bucket)
+            for block_size, bucket in similarity_index["ssdeep_bs"].items()
+        },
+        "ssdeep_parts": dict(similarity_index["ssdeep_parts"]),
+        "tlsh_ids": list(similarity_index["tlsh_ids"]),
+        "tlsh_rows": dict(similarity_index["tlsh_rows"]),
+        "tlsh_mat": similarity_index["tlsh_mat"],
+    }
+
+
+def _append_sha256(lookup: dict, hash_value: str, sha256: str) -> None:
+    """
+    Add a sha256 to the list of a hash without modifying the existing list.
+
+    Indexes copied with copy_similarity_index share their lists, so a new
+    list is stored instead of appending in place.
+
+    Args:
+        lookup (dict): {hash: [sha256]} mapping (modified in-place)
+        hash_value (str): Similarity hash
+        sha256 (str): SHA256 of the file with that hash
+    """
+    lookup[hash_value] = lookup.get(hash_value, []) + [sha256]
+
+
+def add_to_similarity_index(similarity_index: dict, sha256: str, hashes: dict) -> None:
+    """
+    Add a single file to an existing similarity index.
+
+    Incremental counterpart of build_similarity_index: inserting one file
+    only touches the two affected index entries instead of re-scanning the
+    whole database.
+
+    Args:
+        similarity_index (dict): Index built by build_similarity_index
+                                 (modified in-place)
+        sha256 (str): SHA256 of the file being added
+        hashes (dict): File hashes, may contain "tlsh" and "ssdeep"
+
+    Returns:
+        None (modifies similarity_index in-place)
+
+    Performance:
+        - Time: O(1) for the lookup dicts, plus one O(n) copy of the
+          (small) TLSH matrix to append the new row
+
+    Example:
+        >>> index = build_similarity_index(db)
+        >>> add_to_similarity_index(index, "abc123...", {"tlsh": "T1...", "ssdeep": ""})
+    """
+    tlsh_digest = _index_hashes(similarity_index, sha256, hashes)
+    if tlsh_digest is None:
+        return
+
+    try:
+        tlsh_row = decode_tlsh(tlsh_digest)
+    except ValueError as e:
+        logger.warning(f"Invalid TLSH hash for {sha256}: {e}")
+    else:
+        # Extend the ids first so readers never see a row without its id
+        similarity_index["tlsh_ids"].append(sha256)
+        similarity_index["tlsh_mat"] = np.vstack(
+            [similarity_index["tlsh_mat"], tlsh_row]
+        )
+        similarity_index["tlsh_rows"].setdefault(
+            tlsh_digest, len(similarity_index["tlsh_mat"]) - 1
+        )
+
+
+def _index_hashes(similarity_index: dict, sha256: str, hashes: dict):
+    """
+    Add a file to the lookup dicts of the similarity index.
+
+    Args:
+        similarity_index (dict): Index being built (modified in-place)
+        sha256 (str): SHA256 of the file being added
+        hashes (dict): File hashes, may contain "tlsh" and "ssdeep"
+
+    Returns:
+        str | None: TLSH digest to decode into "tlsh_mat", None if the file
+                    has no TLSH of a valid length (e.g. "TNULL")
+    """
+    tlsh_digest = None
+    tlsh_val = hashes.get("tlsh", "")
+    ssdeep_val = hashes.get("ssdeep", "")
+
+    if tlsh_val:
+        _append_sha256(similarity_index["tlsh"], tlsh_val, sha256)
+        if len(tlsh_val) in TLSH_DIGEST_LENGTHS:
+            tlsh_digest = tlsh_val
+        else:
+            logger.warning(f"Invalid TLSH hash for {sha256}: {tlsh_val}")
+    if ssdeep_val:
+        _append_sha256(similarity_index["ssdeep"], ssdeep_val, sha256)
+
+        # Bucket by block size ("<block_size>:<chunk>:<double_chunk>")
+        try:
+            ssdeep_parts = split_ssdeep(ssdeep_val)
+        except ValueError:
+            logger.warning(f"Invalid ssdeep hash for {sha256}: {ssdeep_val}")
+            return tlsh_digest
+        similarity_index["ssdeep_parts"][ssdeep_val] = ssdeep_parts
+        bucket = similarity_index["ssdeep_bs"].setdefault(ssdeep_parts[0], {})
+        _append_sha256(bucket, ssdeep_val, sha256)
+
+    return tlsh_digest
+
+
+def db_signature(path: str = DB_PATH):
+    """
+    Get a cheap fingerprint of a database file and its delta log.
+
+    Args:
+        path (str): Path to the JSON database file (default: db/file_db.json)
+
+    Returns:
+        tuple | None: (mtime_ns, size) of the file, followed by the same for
+                      the delta log when there is one; None if the file
+                      doesn't exist
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    try:
+        delta_st = os.stat(delta_path(path))
+    except OSError:
+        return st.st_mtime_ns, st.st_size
+    return st.st_mtime_ns, st.st_size, delta_st.st_mtime_ns, delta_st.st_size
+
+
 def load_similarity_index(path: str = DB_PATH) -> dict:
     """
     Load database and return only the similarity index.
 
     Convenience function that combines loading the database from disk
-    and building the similarity index in one call.
+    and building the similarity index in one call. The index is memoized
+    per file signature (see db_signature), so repeated calls only stat the
+    file until it changes. The returned index is shared between callers:
+    use copy_similarity_index() before extending it.
 
     Args:
         path (str): Path to the database file (default: db/file_db.json)
@@ -450,10 +1031,99 @@ def load_similarity_index(path: str = DB_PATH) -> dict:
         >>> index = load_similarity_index()
         >>> # Ready to use for similarity searches
     """
+    return _load_similarity_index_cached(path, db_signature(path))
+
+
+@functools.lru_cache(maxsize=4)
+def _load_similarity_index_cached(path: str, signature) -> dict:
+    """
+    Build the similarity index of a database file, memoized by signature.
+
+    Args:
+        path (str): Path to the database file
+        signature (tuple | None): db_signature(path), part of the cache key
+
+    Returns:
+        dict: Similarity index (see build_similarity_index for structure)
+    """
     db = load_db(path)
     return build_similarity_index(db)
 
 
+def load_index_cache(signature, path: str = INDEX_CACHE_PATH):
+    """
+    Load the database and similarity index pickled by save_index_cache().
+
+    The cache starts with INDEX_CACHE_VERSION and the signature of the JSON
+    file it was built from, which are unpickled on their own first, so a
+    stale cache (or one written by another index layout) is rejected
+    without loading the rest.
+
+    Args:
+        signature (tuple): (mtime_ns, size) of the current JSON database
+        path (str): Path to the cache file (default: db/file_db.cache.pkl)
+
+    Returns:
+        tuple | None: (db, similarity_index), or None if there's no cache,
+                      it's unreadable or it was built from another version
+                      of the database
+
+    Example:
+        >>> cached = load_index_cache(signature)
+        >>> if cached is None:
+        ...     db = load_db()
+        ...     index = build_similarity_index(db)
+    """
+    if signature is None or not os.path.exists(path):
+        return None
+
+    try:
+        with open(path, "rb") as f:
+            if pickle.load(f) != (INDEX_CACHE_VERSION, signature):
+                return None
+            return pickle.load(f)
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable index cache {path}: {e}")
+        return None
+
+
+def save_index_cache(
+    signature, db: dict, similarity_index: dict, path: str = INDEX_CACHE_PATH
+) -> None:
+    """
+    Pickle the database and similarity index to skip rebuilding them.
+
+    Loading the pickle is much faster than parsing the JSON and building
+    the index again, which matters when several server processes start at
+    once. The TLSH matrix is a NumPy array, so protocol 5 stores it as one
+    raw buffer. The file is written to a per-process temporary path and
+    then renamed, so concurrent writers never mix their output.
+
+    Args:
+        signature (tuple): (mtime_ns, size) of the JSON database the index
+                           was built from
+        db (dict): Database the index was built from
+        similarity_index (dict): Index from build_similarity_index()
+        path (str): Path to the cache file (default: db/file_db.cache.pkl)
+
+    Example:
+        >>> save_index_cache(signature, db, build_similarity_index(db))
+    """
+    if signature is None:
+        return
+
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    try:
+        with open(tmp_path, "wb") as f:
+            pickle.dump((INDEX_CACHE_VERSION, signature), f, protocol=5)
+            pickle.dump((db, similarity_index), f, protocol=5)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not write index cache {path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
 # -----------------------------
 # Expand arguments (files or directories)
 # -----------------------------
@@ -487,15 +1157,20 @@ def expand_arguments(args):
     expanded = []
 
     for arg in args:
-        if os.path.isfile(arg):
+        # One stat per argument answers both "file?" and "directory?"
+        try:
+            mode = os.stat(arg).st_mode
+        except OSError:
+            mode = 0
+
+        if stat.S_ISREG(mode):
             expanded.append(arg)
 
-        elif os.path.isdir(arg):
-            # Add ALL files inside the directory (non-recursive)
-            for entry in os.listdir(arg):
-                full_path = os.path.join(arg, entry)
-                if os.path.isfile(full_path):
-                    expanded.append(full_path)
+        elif stat.S_ISDIR(mode):
+            # Add ALL files inside the directory (non-recursive). scandir
+            # reuses the file type read with the listing, one stat less each
+            with os.scandir(arg) as it:
+                expanded.extend(entry.path for entry in it if entry.is_file())
 
         else:
             print(f"[WARN] Path does not exist: {arg}")
@@ -512,6 +1187,10 @@ def main(argv=None):
 
     Processes command-line arguments, expands directories, computes hashes
     for all files, updates the database, and builds the similarity index.
+    Changed entries are appended to the delta log; the whole database is
+    only rewritten when it doesn't exist yet or with --compact. The
+    database and index are taken from the index cache when it's current,
+    new entries are added to that index, and the result is cached again.
 
     Args:
         argv (list | None): Command-line arguments (default: sys.argv[1:])
@@ -527,10 +1206,12 @@ def main(argv=None):
     Workflow:
         1. Parse command-line arguments
         2. Expand directories to file list
-        3. Load existing database
-        4. Process each file (compute hashes, update database)
-        5. Save updated database to disk
-        6. Build and display similarity index statistics
+        3. Load existing database (and the stat cache of previous runs)
+        4. Process each file (hashes computed in parallel worker processes,
+           database updated in order from the main process)
+        5. Append changed entries to the delta log (or write the database)
+        6. Update (or with --rebuild-index, build) the similarity index,
+           cache it and display its statistics
 
     Output:
         Prints progress information to stdout:
@@ -550,7 +1231,16 @@ def main(argv=None):
         # Mix files and directories
         $ python3 db/json_parser.py file1.exe /path/to/dir/ file2.pdf
 
-    Example Output:
+        # Fold the delta log into file_db.json (alone or with files)
+        $ python3 db/json_parser.py --compact
+
+        # Ignore the index cache and build the similarity index again
+        $ python3 db/json_parser.py --rebuild-index file1.exe
+
+        # Also log every file processed
+        $ python3 db/json_parser.py -v /path/to/dir/
+
+    Example Output (with -v; without it the per-file lines are omitted):
         [INFO] Loaded database with 100 existing entries
         [INFO] Processing: /path/to/file1.exe
         [INFO] Creating new entry: abc123... (file1.exe)
@@ -565,17 +1255,36 @@ def main(argv=None):
                Errors: 0
                Saved to: db/file_db.json
 
-        [INFO] Similarity index built:
+        [INFO] Similarity index updated:
                TLSH hashes: 95
                ssdeep hashes: 85
     """
     if argv is None:
         argv = sys.argv[1:]
 
-    if not argv:
-        print(f"Usage: {sys.argv[0]} <file1|dir1> [file2|dir2 ...]")
+    flags = {"--compact", "--rebuild-index", "-v", "--verbose"}
+    compact = "--compact" in argv
+    rebuild_index = "--rebuild-index" in argv
+    verbose = "-v" in argv or "--verbose" in argv
+    argv = [arg for arg in argv if arg not in flags]
+
+    if not argv and not compact:
+        print(
+            f"Usage: {sys.argv[0]} [-v] [--compact] [--rebuild-index] <file1|dir1> [file2|dir2 ...]"
+        )
         sys.exit(1)
 
+    # Warnings and errors always show, per-file progress only with -v
+    logging.basicConfig(
+        level=logging.INFO if verbose else logging.WARNING,
+        format="[%(levelname)s] %(message)s",
+    )
+
+    if not argv:
+        db = compact_db(DB_PATH)
+        print(f"[INFO] Compacted database with {len(db)} entries into {DB_PATH}")
+        return
+
     # Expand directories → list of files
     file_list = expand_arguments(argv)
 
@@ -583,29 +1292,97 @@ def main(argv=None):
         print("[ERROR] No valid files found to process.")
         sys.exit(1)
 
-    db = load_db(DB_PATH)
+    # Reuse the cached database and index if they match the files on disk
+    cached = None if rebuild_index else load_index_cache(db_signature(DB_PATH))
+    if cached is not None:
+        db, sim_index = cached
+    else:
+        db = load_db(DB_PATH)
+        sim_index = None
     print(f"[INFO] Loaded database with {len(db)} existing entries")
 
     processed_count = 0
     error_count = 0
+    changed = {}  # Ordered set of the sha256 created or updated
+    name_sets = {}
+    # Files processed in one run share the same upload timestamp
+    now_iso = _utc_timestamp()
+
+    # Files already in the database only need their SHA256 (see
+    # compute_meta_unless_known), matched against the entries loaded above
+    known_sizes = frozenset(entry.get("size") for entry in db.values())
+    known_sha256 = frozenset(db)
+
+    # Files whose size and mtime didn't change since a previous run keep
+    # the SHA256 recorded then, without reading them at all. The cache is
+    # only an optimization: a broken one is rebuilt instead of aborting.
+    try:
+        stat_cache = _load_base(STAT_CACHE_PATH)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable stat cache {STAT_CACHE_PATH}: {e}")
+        stat_cache = {}
+
+    # Hash files in parallel processes (TLSH, ssdeep and text extraction
+    # hold the GIL), but only touch the database from this process
+    with ProcessPoolExecutor(
+        initializer=_init_worker, initargs=(known_sizes, known_sha256)
+    ) as executor:
+        jobs = []
+        for file_path in file_list:
+            stamp = _file_stamp(file_path)
+            cached = stat_cache.get(stamp[0]) if stamp is not None else None
+            if (
+                cached is not None
+                and cached[:2] == stamp[1]
+                and cached[2] in known_sha256
+            ):
+                jobs.append((file_path, stamp, {"sha256": cached[2]}, None))
+            else:
+                future = executor.submit(_compute_meta_in_worker, file_path)
+                jobs.append((file_path, stamp, None, future))
+
+        for file_path, stamp, meta, future in jobs:
+            try:
+                if meta is None:
+                    meta = future.result()
+                if stamp is not None:
+                    stat_cache[stamp[0]] = stamp[1] + [meta["sha256"]]
+                is_new = meta["sha256"] not in db
+                sha256 = update_db_with_file(file_path, db, meta, name_sets, now_iso)
+                if sha256 is not None:
+                    changed[sha256] = None
+                    # Only new entries add hashes; name/date updates don't
+                    if is_new and sim_index is not None:
+                        add_to_similarity_index(sim_index, sha256, db[sha256]["hashes"])
+                processed_count += 1
+            except Exception as e:
+                logger.error(f"Failed to process {file_path}: {e}")
+                error_count += 1
+
+    if compact or not os.path.exists(DB_PATH):
+        save_db(db, DB_PATH)
+        clear_delta(DB_PATH)
+        saved_to = DB_PATH
+        # The file has its keys sorted: index in the order it loads back in
+        db = dict(sorted(db.items()))
+        sim_index = None
+    else:
+        append_delta({sha256: db[sha256] for sha256 in changed}, DB_PATH)
+        saved_to = delta_path(DB_PATH)
 
-    for file_path in file_list:
-        try:
-            update_db_with_file(file_path, db)
-            processed_count += 1
-        except Exception as e:
-            print(f"[ERROR] Failed to process {file_path}: {e}")
-            error_count += 1
+    save_db(stat_cache, STAT_CACHE_PATH, pretty=False)
 
-    save_db(db, DB_PATH)
     print(f"\n[INFO] Database update complete:")
     print(f"       Total entries: {len(db)}")
     print(f"       Files processed: {processed_count}")
     print(f"       Errors: {error_count}")
-    print(f"       Saved to: {DB_PATH}")
+    print(f"       Saved to: {saved_to}")
+
+    if sim_index is None:
+        sim_index = build_similarity_index(db)
+    save_index_cache(db_signature(DB_PATH), db, sim_index)
 
-    sim_index = build_similarity_index(db)
-    print(f"\n[INFO] Similarity index built:")
+    print(f"\n[INFO] Similarity index updated:")
     print(f"       TLSH hashes: {len(sim_index['tlsh'])}")
     print(f"       ssdeep hashes: {len(sim_index['ssdeep'])}")
 
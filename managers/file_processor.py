@@ -19,6 +19,7 @@ Dependencies:
     - PyMuPDF (fitz): PDF text extraction
 """
 
+import functools
 import magic
 from docx import Document
 import fitz  # PyMuPDF
@@ -26,6 +27,89 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# libmagic loads its signature database on creation, so share one instance
+# (python-magic serializes calls to it with an internal lock)
+_MAGIC = magic.Magic(mime=True)
+
+# ELF e_type values whose MIME type libmagic reports unambiguously
+_ELF_MIME_TYPES = {
+    1: "application/x-object",
+    2: "application/x-executable",
+}
+
+
+def _sniff_mime_type(data):
+    """
+    Cheap MIME detection from the magic bytes of the most common formats.
+
+    Only answers when the result is the same libmagic would give (PDF,
+    PE/DOS executables and non-PIE ELF files); everything else, including
+    ZIP-based Office documents, falls through to libmagic.
+
+    Args:
+        data (bytes): Raw file content
+
+    Returns:
+        str | None: MIME type, or None if libmagic must be consulted
+
+    Example:
+        >>> _sniff_mime_type(b"%PDF-1.7...")
+        'application/pdf'
+    """
+    if data.startswith(b"%PDF-"):
+        return "application/pdf"
+
+    if data.startswith(b"MZ") and len(data) >= 64:
+        pe_offset = int.from_bytes(data[0x3C:0x40], "little")
+        if data[pe_offset : pe_offset + 4] == b"PE\0\0":
+            return "application/vnd.microsoft.portable-executable"
+        return None
+
+    if data.startswith(b"\x7fELF") and len(data) >= 18:
+        byteorder = "big" if data[5] == 2 else "little"
+        return _ELF_MIME_TYPES.get(int.from_bytes(data[16:18], byteorder))
+
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def _handler_name(file_type):
+    """
+    Pick the FileProcessor method that handles a MIME type.
+
+    Only a handful of distinct MIME types show up in practice, so the
+    substring checks run once per type and later files hit the cache.
+
+    Args:
+        file_type (str): MIME type reported by _detect_file_type()
+
+    Returns:
+        str: Name of the _process_* method to call
+
+    Example:
+        >>> _handler_name("application/pdf")
+        '_process_pdf'
+    """
+    # PDF
+    if "pdf" in file_type:
+        return "_process_pdf"
+
+    # Word
+    if "word" in file_type or "officedocument" in file_type:
+        return "_process_docx"
+
+    # Executables
+    if (
+        "x-executable" in file_type
+        or "x-dosexec" in file_type
+        or "x-sharedlib" in file_type
+        or "elf" in file_type.lower()
+    ):
+        return "_process_binary"
+
+    # Any other file type: raw content
+    return "_process_generic"
+
 
 class FileProcessor:
     """
@@ -58,7 +142,8 @@ class FileProcessor:
         Detect file type using libmagic.
 
         Uses python-magic library to detect the MIME type of the file
-        based on its content (not just the extension).
+        based on its content (not just the extension). PDF, PE and ELF
+        headers are recognized directly without calling into libmagic.
 
         Returns:
             str: MIME type (e.g., "application/pdf", "text/plain")
@@ -68,8 +153,9 @@ class FileProcessor:
             >>> mime_type = processor._detect_file_type()
             >>> print(mime_type)  # "application/pdf"
         """
-        mime = magic.Magic(mime=True)
-        detected_type = mime.from_buffer(self.file_data)
+        detected_type = _sniff_mime_type(self.file_data)
+        if detected_type is None:
+            detected_type = _MAGIC.from_buffer(self.file_data)
         logger.debug(f"File type detected for {self.filename}: {detected_type}")
         return detected_type
 
@@ -105,27 +191,7 @@ class FileProcessor:
             ...     print(f"Extracted {len(content)} bytes")
         """
         logger.info(f"Processing file: {self.filename} (type: {self.file_type})")
-
-        # PDF
-        if "pdf" in self.file_type:
-            return self._process_pdf()
-
-        # Word
-        elif "word" in self.file_type or "officedocument" in self.file_type:
-            return self._process_docx()
-
-        # Executables and other files: return raw content
-        elif (
-            "x-executable" in self.file_type
-            or "x-dosexec" in self.file_type
-            or "x-sharedlib" in self.file_type
-            or "elf" in self.file_type.lower()
-        ):
-            return self._process_binary()
-
-        # Any other file type: raw content
-        else:
-            return self._process_generic()
+        return getattr(self, _handler_name(self.file_type))()
 
     def _process_binary(self):
         """
@@ -207,12 +273,12 @@ class FileProcessor:
         try:
             logger.debug(f"Extracting text from PDF: {self.filename}")
             doc = fitz.open(stream=self.file_data, filetype="pdf")
-            text = ""
-            page_count = len(doc)
-
-            for page in doc:
-                text += page.get_text()
-            doc.close()
+            try:
+                page_count = len(doc)
+                # Join once instead of copying the text so far on every page
+                text = "".join([page.get_text() for page in doc])
+            finally:
+                doc.close()
 
             text_length = len(text.strip())
 
@@ -265,10 +331,12 @@ class FileProcessor:
         try:
             logger.debug(f"Extracting text from DOCX: {self.filename}")
             doc = Document(io.BytesIO(self.file_data))
-            text = "\n".join([para.text for para in doc.paragraphs])
+            # doc.paragraphs rebuilds the paragraph list on every access
+            paragraphs = doc.paragraphs
+            text = "\n".join([para.text for para in paragraphs])
 
             text_length = len(text.strip())
-            para_count = len(doc.paragraphs)
+            para_count = len(paragraphs)
 
             if not text or text_length < 1:
                 logger.warning(
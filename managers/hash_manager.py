@@ -10,14 +10,28 @@ Classes:
 Dependencies:
     - tlsh: Trend Micro Locality Sensitive Hash library
     - ssdeep: Context-triggered piecewise hashing library
+    - numpy: Vectorized TLSH distance computation (see tlsh_matrix)
 """
 
 import tlsh
 import ssdeep
+import heapq
 import logging
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from managers.ssdeep_digest import may_match, split_ssdeep
+from managers.tlsh_matrix import (
+    body_fingerprints,
+    decode_tlsh,
+    tlsh_distances,
+    tlsh_lower_bounds,
+)
 
 logger = logging.getLogger(__name__)
 
+# Runs the ssdeep half of compare_file() alongside the TLSH half
+_ssdeep_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ssdeep")
+
 
 class HashManager:
     """
@@ -28,7 +42,13 @@ class HashManager:
 
     Attributes:
         database (dict): Complete file database {sha256: {metadata}}
-        similarity_index (dict): Fast lookup index {tlsh: {hash: sha256}, ssdeep: {hash: sha256}}
+        similarity_index (dict): Fast lookup index {tlsh: {hash: [sha256]}, ssdeep: {hash: [sha256]}}
+        tlsh_matrix (np.ndarray): Decoded TLSH digests, one (35,) row per file
+                                  (the index's "tlsh_mat")
+        tlsh_sha256 (list): SHA256 of the file behind each tlsh_matrix row
+                            (the index's "tlsh_ids")
+        tlsh_fp (np.ndarray): Bodies of tlsh_matrix packed as (N, 4) uint64
+                              words, used to prefilter TLSH searches
     """
 
     def __init__(self, database, similarity_index):
@@ -37,10 +57,16 @@ class HashManager:
 
         Args:
             database (dict): Complete database with format {sha256: {metadata, hashes, ...}}
-            similarity_index (dict): Similarity index {tlsh: {hash: sha256}, ssdeep: {...}}
+            similarity_index (dict): Similarity index {tlsh: {hash: [sha256]}, ssdeep: {...}}
         """
         self.database = database
         self.similarity_index = similarity_index
+
+        # Decoded TLSH digests, built once with the index (see build_similarity_index)
+        self.tlsh_matrix = similarity_index["tlsh_mat"]
+        self.tlsh_sha256 = similarity_index["tlsh_ids"]
+        self.tlsh_fp = body_fingerprints(self.tlsh_matrix)
+
         logger.debug(f"HashManager initialized with {len(database)} entries")
 
     def calculate_tlsh(self, content):
@@ -136,17 +162,22 @@ class HashManager:
             logger.error(f"Error computing ssdeep: {e}")
             return False, f"Cannot compute ssdeep: {str(e)}"
 
-    def find_matches_tlsh(self, uploaded_hash, top_n=10):
+    def find_matches_tlsh(self, uploaded_hash, top_n=10, max_distance=None):
         """
         Find the closest matches using TLSH distance.
 
         Compares the uploaded file's TLSH hash against all TLSH hashes
         in the database and returns the most similar files. Lower distance
-        means more similar files.
+        means more similar files. Distances are computed in vectorized
+        passes over the decoded digests (see tlsh_matrix), and only for the
+        rows whose cheap lower bound can still reach the top N (or, with
+        max_distance, stay within the threshold).
 
         Args:
             uploaded_hash (str): TLSH hash of the uploaded file
             top_n (int): Number of top matches to return (default: 10)
+            max_distance (int | None): Only keep matches at this distance or
+                                       closer (default: None, no threshold)
 
         Returns:
             dict: TLSH matching results containing:
@@ -163,70 +194,119 @@ class HashManager:
             >>> for match in results['top_matches']:
             ...     print(f"{match['name']}: distance={match['distance']}")
         """
-        best_match_sha256 = None
-        best_match = None
-        min_distance = float("inf")
-        all_matches = []
+        n_rows = len(self.tlsh_matrix)
+        logger.debug(f"Comparing TLSH against {n_rows} entries")
 
-        # Iterate over all TLSH hashes in the index
-        tlsh_index = self.similarity_index.get("tlsh", {})
-        logger.debug(f"Comparing TLSH against {len(tlsh_index)} entries")
-
-        for db_tlsh, sha256 in tlsh_index.items():
+        # Hashes already in the index (e.g. /api/file) are decoded once there
+        query_row = self.similarity_index.get("tlsh_rows", {}).get(uploaded_hash)
+        if query_row is not None and query_row < n_rows:
+            query = self.tlsh_matrix[query_row]
+        else:
             try:
-                # Calculate distance (0 = identical, larger = more different)
-                distance = tlsh.diff(uploaded_hash, db_tlsh)
+                query = decode_tlsh(uploaded_hash)
+            except ValueError as e:
+                logger.error(f"Cannot compare invalid TLSH {uploaded_hash}: {e}")
+                n_rows = 0
 
-                # Get complete file metadata
-                file_entry = self.database.get(sha256, {})
-
-                match_info = {
+        if n_rows == 0:
+            logger.info("No TLSH matches found")
+            return self._no_tlsh_matches()
+
+        top_n = min(top_n, n_rows)
+        rows = np.arange(n_rows)
+
+        # Threshold: rows whose bound is already above it can never match,
+        # and all the others are scored so the match count stays exact
+        if max_distance is not None:
+            bounds = tlsh_lower_bounds(query, self.tlsh_matrix, self.tlsh_fp)
+            rows = np.flatnonzero(bounds <= max_distance)
+
+        # Prefilter: the exact distances of the top_n rows with the lowest
+        # bound cap the N-th best distance, so any row whose bound is above
+        # that cap can't make it into the top N and is never scored
+        elif top_n < n_rows:
+            bounds = tlsh_lower_bounds(query, self.tlsh_matrix, self.tlsh_fp)
+            probe = np.argpartition(bounds, top_n - 1)[:top_n]
+            cutoff = tlsh_distances(
+                query, self.tlsh_matrix[probe], self.tlsh_fp[probe]
+            ).max()
+            rows = np.flatnonzero(bounds <= cutoff)
+        logger.debug(f"TLSH prefilter kept {len(rows)}/{n_rows} entries")
+
+        # Exact distances (0 = identical, larger = more different)
+        distances = tlsh_distances(query, self.tlsh_matrix[rows], self.tlsh_fp[rows])
+
+        n_matches = n_rows
+        if max_distance is not None:
+            within = distances <= max_distance
+            rows, distances = rows[within], distances[within]
+            n_matches = len(rows)
+            if n_matches == 0:
+                logger.info(f"No TLSH matches within distance {max_distance}")
+                return self._no_tlsh_matches()
+            top_n = min(top_n, n_matches)
+
+        # Select the top N without sorting everything. Ties are broken by row
+        # order (distance * n + row is unique), like a stable sort would.
+        keys = distances.astype(np.int64) * n_rows + rows
+        top_idx = np.argpartition(keys, top_n - 1)[:top_n]
+        top_idx = top_idx[np.argsort(keys[top_idx])]
+
+        top_matches = []
+        for i in top_idx:
+            sha256 = self.tlsh_sha256[rows[i]]
+            # Get complete file metadata
+            file_entry = self.database.get(sha256, {})
+            top_matches.append(
+                {
                     "sha256": sha256,
                     "name": file_entry.get("name", ["Unknown"]),
                     "family": file_entry.get("family", "Unknown"),
                     "file_type": file_entry.get("file_type", "Unknown"),
                     "tags": file_entry.get("tags", []),
-                    "tlsh": db_tlsh,
-                    "distance": distance,
+                    "tlsh": file_entry.get("hashes", {}).get("tlsh"),
+                    "distance": int(distances[i]),
                 }
-
-                all_matches.append(match_info)
-
-                if distance < min_distance:
-                    min_distance = distance
-                    best_match_sha256 = sha256
-                    best_match = file_entry
-
-            except Exception as e:
-                logger.error(f"Error comparing TLSH with {sha256}: {e}")
-                continue
-
-        # Sort by distance (lower = more similar)
-        all_matches.sort(key=lambda x: x["distance"])
-        top_matches = all_matches[:top_n]
-
-        if best_match_sha256:
-            logger.info(
-                f"TLSH best match: {best_match_sha256} (distance: {min_distance})"
             )
-        else:
-            logger.info("No TLSH matches found")
+
+        best_idx = top_idx[0]
+        best_match_sha256 = self.tlsh_sha256[rows[best_idx]]
+        min_distance = int(distances[best_idx])
+        logger.info(f"TLSH best match: {best_match_sha256} (distance: {min_distance})")
 
         return {
-            "best_match": best_match,
+            "best_match": self.database.get(best_match_sha256, {}),
             "best_match_sha256": best_match_sha256,
-            "min_distance": min_distance if min_distance != float("inf") else None,
+            "min_distance": min_distance,
             "top_matches": top_matches,
-            "all_matches_count": len(all_matches),
+            "all_matches_count": n_matches,
+        }
+
+    @staticmethod
+    def _no_tlsh_matches():
+        """
+        Build the find_matches_tlsh() result for a search without matches.
+
+        Returns:
+            dict: Result with no best match and an empty top_matches list
+        """
+        return {
+            "best_match": None,
+            "best_match_sha256": None,
+            "min_distance": None,
+            "top_matches": [],
+            "all_matches_count": 0,
         }
 
     def find_matches_ssdeep(self, uploaded_hash, top_n=10):
         """
         Find the closest matches using ssdeep similarity.
 
-        Compares the uploaded file's ssdeep hash against all ssdeep hashes
+        Compares the uploaded file's ssdeep hash against the ssdeep hashes
         in the database and returns the most similar files. Higher similarity
-        means more similar files (0-100 scale).
+        means more similar files (0-100 scale). Only hashes with a compatible
+        block size that share a 7-character substring with the query are
+        compared, as any other pair always scores 0 (see ssdeep_digest).
 
         Args:
             uploaded_hash (str): ssdeep hash of the uploaded file
@@ -247,28 +327,57 @@ class HashManager:
             >>> for match in results['top_matches']:
             ...     print(f"{match['name']}: {match['similarity']}%")
         """
-        best_match_sha256 = None
-        best_match = None
-        max_similarity = 0
-        all_matches = []
+        scored = []  # (similarity, db_ssdeep, sha256) of every match
 
-        # Iterate over all ssdeep hashes in the index
-        ssdeep_index = self.similarity_index.get("ssdeep", {})
-        logger.debug(f"Comparing ssdeep against {len(ssdeep_index)} entries")
+        # Hashes already in the index (e.g. /api/file) were split there
+        ssdeep_parts = self.similarity_index.get("ssdeep_parts", {})
+        query_parts = ssdeep_parts.get(uploaded_hash)
+        if query_parts is None:
+            try:
+                query_parts = split_ssdeep(uploaded_hash)
+            except ValueError:
+                logger.error(f"Cannot compare invalid ssdeep hash: {uploaded_hash}")
+
+        # ssdeep only scores digests with equal, half or double block size,
+        # so only those buckets of the index are compared
+        candidates = []
+        if query_parts is not None:
+            block_size = query_parts[0]
+            buckets = self.similarity_index.get("ssdeep_bs", {})
+            for bs in (block_size // 2, block_size, block_size * 2):
+                candidates.extend(buckets.get(bs, {}).items())
+        logger.debug(f"Comparing ssdeep against {len(candidates)} entries")
+
+        for db_ssdeep, sha256_list in candidates:
+            # Skip pairs without a common 7-gram, ssdeep would score them 0
+            db_parts = ssdeep_parts.get(db_ssdeep)
+            if db_parts is not None and not may_match(query_parts, db_parts):
+                continue
 
-        for db_ssdeep, sha256 in ssdeep_index.items():
             try:
                 # ssdeep.compare() returns a value 0-100 (100 = identical)
                 similarity = ssdeep.compare(uploaded_hash, db_ssdeep)
+            except Exception as e:
+                logger.error(f"Error comparing ssdeep with {sha256_list}: {e}")
+                continue
+
+            # Only consider if there's any similarity
+            if similarity == 0:
+                continue
 
-                # Only consider if there's any similarity
-                if similarity == 0:
-                    continue
+            for sha256 in sha256_list:
+                scored.append((similarity, db_ssdeep, sha256))
 
-                # Get complete file metadata
-                file_entry = self.database.get(sha256, {})
+        # Top N by similarity (higher = more similar) in O(n log N); ties
+        # keep their comparison order, like a stable sort would
+        top_scored = heapq.nlargest(top_n, scored, key=lambda x: x[0])
 
-                match_info = {
+        top_matches = []
+        for similarity, db_ssdeep, sha256 in top_scored:
+            # Get complete file metadata
+            file_entry = self.database.get(sha256, {})
+            top_matches.append(
+                {
                     "sha256": sha256,
                     "name": file_entry.get("name", ["Unknown"]),
                     "family": file_entry.get("family", "Unknown"),
@@ -277,37 +386,69 @@ class HashManager:
                     "ssdeep": db_ssdeep,
                     "similarity": similarity,
                 }
-
-                all_matches.append(match_info)
-
-                if similarity > max_similarity:
-                    max_similarity = similarity
-                    best_match_sha256 = sha256
-                    best_match = file_entry
-
-            except Exception as e:
-                logger.error(f"Error comparing ssdeep with {sha256}: {e}")
-                continue
-
-        # Sort by similarity (higher = more similar)
-        all_matches.sort(key=lambda x: x["similarity"], reverse=True)
-        top_matches = all_matches[:top_n]
-
-        if best_match_sha256:
-            logger.info(
-                f"ssdeep best match: {best_match_sha256} (similarity: {max_similarity}%)"
             )
-        else:
+
+        if not top_scored:
             logger.info("No ssdeep matches found")
+            return {
+                "best_match": None,
+                "best_match_sha256": None,
+                "max_similarity": None,
+                "top_matches": [],
+                "all_matches_count": 0,
+            }
+
+        max_similarity, _, best_match_sha256 = top_scored[0]
+        logger.info(
+            f"ssdeep best match: {best_match_sha256} (similarity: {max_similarity}%)"
+        )
 
         return {
-            "best_match": best_match,
+            "best_match": self.database.get(best_match_sha256, {}),
             "best_match_sha256": best_match_sha256,
-            "max_similarity": max_similarity if max_similarity > 0 else None,
+            "max_similarity": max_similarity,
             "top_matches": top_matches,
-            "all_matches_count": len(all_matches),
+            "all_matches_count": len(scored),
         }
 
+    def compare_hashes(self, hashes_a, hashes_b):
+        """
+        Compare the similarity hashes of two files directly.
+
+        Args:
+            hashes_a (dict): Hashes of the first file ("tlsh", "ssdeep")
+            hashes_b (dict): Hashes of the second file ("tlsh", "ssdeep")
+
+        Returns:
+            tuple: (tlsh_distance: int | None, ssdeep_similarity: int | None)
+                Each value is None if either file lacks that hash or the
+                comparison fails.
+
+        Example:
+            >>> manager = HashManager(db, index)
+            >>> distance, similarity = manager.compare_hashes(
+            ...     db[sha_a]["hashes"], db[sha_b]["hashes"]
+            ... )
+        """
+        tlsh_distance = None
+        ssdeep_similarity = None
+
+        if hashes_a.get("tlsh") and hashes_b.get("tlsh"):
+            try:
+                tlsh_distance = tlsh.diff(hashes_a["tlsh"], hashes_b["tlsh"])
+            except Exception as e:
+                logger.error(f"Error comparing TLSH hashes: {e}")
+
+        if hashes_a.get("ssdeep") and hashes_b.get("ssdeep"):
+            try:
+                ssdeep_similarity = ssdeep.compare(
+                    hashes_a["ssdeep"], hashes_b["ssdeep"]
+                )
+            except Exception as e:
+                logger.error(f"Error comparing ssdeep hashes: {e}")
+
+        return tlsh_distance, ssdeep_similarity
+
     def compare_file(self, content, top_n=10, use_ssdeep=True):
         """
         Complete pipeline: calculate TLSH/ssdeep and find matches.
@@ -358,6 +499,13 @@ class HashManager:
 
         result = {"content_size": len(content), "tlsh": {}, "ssdeep": {}}
 
+        # ssdeep hashing and search don't depend on TLSH, run them concurrently
+        ssdeep_future = None
+        if use_ssdeep:
+            ssdeep_future = _ssdeep_executor.submit(
+                self._compare_ssdeep, content, top_n
+            )
+
         # Calculate TLSH
         success_tlsh, tlsh_result = self.calculate_tlsh(content)
 
@@ -372,20 +520,32 @@ class HashManager:
         tlsh_matches = self.find_matches_tlsh(uploaded_tlsh, top_n)
         result["tlsh"]["matches"] = tlsh_matches
 
-        # Calculate ssdeep (optional)
-        if use_ssdeep:
-            success_ssdeep, ssdeep_result = self.calculate_ssdeep(content)
-
-            if success_ssdeep:
-                uploaded_ssdeep = ssdeep_result
-                result["ssdeep"]["hash"] = uploaded_ssdeep
-
-                # Find ssdeep matches
-                ssdeep_matches = self.find_matches_ssdeep(uploaded_ssdeep, top_n)
-                result["ssdeep"]["matches"] = ssdeep_matches
-            else:
-                logger.warning(f"ssdeep calculation failed: {ssdeep_result}")
-                result["ssdeep"]["error"] = ssdeep_result
+        # Collect ssdeep (optional)
+        if ssdeep_future is not None:
+            result["ssdeep"] = ssdeep_future.result()
 
         logger.info("Hash comparison completed successfully")
         return True, result
+
+    def _compare_ssdeep(self, content, top_n):
+        """
+        Calculate the ssdeep hash of the content and find its matches.
+
+        Runs on the ssdeep worker pool while compare_file() handles TLSH.
+
+        Args:
+            content (bytes): Processed file content
+            top_n (int): Number of top matches to return
+
+        Returns:
+            dict: {'hash': str, 'matches': dict} or {'error': str}
+        """
+        success_ssdeep, ssdeep_result = self.calculate_ssdeep(content)
+
+        if not success_ssdeep:
+            logger.warning(f"ssdeep calculation failed: {ssdeep_result}")
+            return {"error": ssdeep_result}
+
+        # Find ssdeep matches
+        ssdeep_matches = self.find_matches_ssdeep(ssdeep_result, top_n)
+        return {"hash": ssdeep_result, "matches": ssdeep_matches}
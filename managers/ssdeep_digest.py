@@ -0,0 +1,125 @@
+"""
+ssdeep Digest Module
+
+This module splits ssdeep digests into their parts once, so candidates that
+can't possibly match a query are discarded before calling ssdeep.compare().
+
+An ssdeep digest has the form "<block_size>:<chunk>:<double_chunk>".
+ssdeep.compare() eliminates runs of more than 3 identical characters from
+both chunks and then only scores a pair of chunks if they share at least
+one substring of ROLLING_WINDOW (7) characters; otherwise the edit distance
+is never computed and the score is 0. Checking that condition with
+precomputed 7-gram sets is much cheaper than the full comparison and never
+discards a pair ssdeep would score above 0.
+
+Functions:
+    split_ssdeep: Parse a digest into block size, chunks and 7-gram sets
+    may_match: Cheap test of whether two split digests can score above 0
+
+Dependencies:
+    None (standard library only)
+"""
+
+import re
+
+ROLLING_WINDOW = 7
+
+# Runs of more than 3 identical characters, which ssdeep.compare() ignores
+_SEQUENCE_RE = re.compile(r"(.)\1{3,}")
+
+
+def _eliminate_sequences(chunk):
+    """
+    Shorten runs of identical characters to 3, like ssdeep.compare() does.
+
+    Args:
+        chunk (str): One chunk of an ssdeep digest
+
+    Returns:
+        str: Chunk without runs longer than 3 characters
+    """
+    return _SEQUENCE_RE.sub(r"\1\1\1", chunk)
+
+
+def _grams(chunk):
+    """
+    Get every ROLLING_WINDOW-character substring of a chunk.
+
+    Args:
+        chunk (str): Chunk with sequences already eliminated
+
+    Returns:
+        frozenset: 7-character substrings (empty if the chunk is shorter)
+    """
+    return frozenset(
+        chunk[i : i + ROLLING_WINDOW] for i in range(len(chunk) - ROLLING_WINDOW + 1)
+    )
+
+
+def split_ssdeep(digest):
+    """
+    Split an ssdeep digest into the parts used by may_match().
+
+    Args:
+        digest (str): ssdeep digest, e.g. "192:abcd...:efgh..."
+
+    Returns:
+        tuple: (block_size, chunk, double_chunk, chunk_grams, double_chunk_grams)
+            - block_size (int): Block size of the digest
+            - chunk, double_chunk (str): Chunks with sequences eliminated
+            - chunk_grams, double_chunk_grams (frozenset): Their 7-grams
+
+    Raises:
+        ValueError: If the digest isn't "<int>:<chunk>:<chunk>"
+
+    Example:
+        >>> parts = split_ssdeep("3:AXGBicFlgVNhBGcL6wCrFQEv:AXGHsNhxLsr2C")
+        >>> parts[0]
+        3
+    """
+    block_size, chunk, double_chunk = digest.split(":", 2)
+    chunk = _eliminate_sequences(chunk)
+    double_chunk = _eliminate_sequences(double_chunk)
+    return (
+        int(block_size),
+        chunk,
+        double_chunk,
+        _grams(chunk),
+        _grams(double_chunk),
+    )
+
+
+def may_match(query, candidate):
+    """
+    Check whether ssdeep.compare() can score two digests above 0.
+
+    Mirrors the early exits of ssdeep.compare(): block sizes must be equal
+    or differ by 2x, and the chunks compared for those block sizes must
+    share a 7-character substring (identical digests always match).
+
+    Args:
+        query (tuple): split_ssdeep() of the first digest
+        candidate (tuple): split_ssdeep() of the second digest
+
+    Returns:
+        bool: False if the score is guaranteed to be 0, True otherwise
+
+    Example:
+        >>> q = split_ssdeep(uploaded_hash)
+        >>> if may_match(q, split_ssdeep(db_hash)):
+        ...     similarity = ssdeep.compare(uploaded_hash, db_hash)
+    """
+    q_bs, q_chunk, _, q_grams, q_double_grams = query
+    c_bs, c_chunk, _, c_grams, c_double_grams = candidate
+
+    if q_bs == c_bs:
+        return (
+            q_chunk == c_chunk
+            or not q_grams.isdisjoint(c_grams)
+            or not q_double_grams.isdisjoint(c_double_grams)
+        )
+    if q_bs == c_bs * 2:
+        return not q_grams.isdisjoint(c_double_grams)
+    if c_bs == q_bs * 2:
+        return not q_double_grams.isdisjoint(c_grams)
+    return False
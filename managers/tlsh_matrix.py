@@ -0,0 +1,309 @@
+"""
+TLSH Matrix Module
+
+This module provides a vectorized implementation of the TLSH distance so
+that a query can be compared against the whole database in a single NumPy
+pass instead of one tlsh.diff() call per entry.
+
+A TLSH digest ("T1" + 70 hex chars) encodes 35 bytes:
+    - byte 0: checksum
+    - byte 1: Lvalue (log of the content length)
+    - byte 2: Q ratios (two 4-bit values)
+    - bytes 3-34: body (128 buckets, 2 bits each)
+
+Digests are decoded once into rows of an (N, 35) uint8 matrix (the
+"tlsh_mat" entry of the similarity index) and the distance is computed
+exactly like libtlsh's totalDiff() (length included), so results are
+identical to tlsh.diff().
+
+Before the exact distance, the bodies can be compared as four 64-bit words
+with XOR + popcount (body_fingerprints / tlsh_lower_bounds). Half the
+number of differing bits never exceeds the real distance, so rows whose
+bound is already worse than the current top N can be skipped safely.
+
+Functions:
+    decode_tlsh: Decode a TLSH hex digest into a 35-byte row
+    decode_tlsh_batch: Decode many TLSH digests into an (N, 35) matrix
+    body_fingerprints: Pack matrix bodies into (N, 4) uint64 words
+    tlsh_lower_bounds: Cheap lower bound of the distance to every row
+    tlsh_distances: Distance from one decoded digest to every matrix row
+
+Dependencies:
+    - numpy: Vectorized array operations
+"""
+
+import numpy as np
+
+TLSH_HEX_LEN = 70  # 35 bytes, without the "T1" version prefix
+TLSH_DIGEST_LENGTHS = (TLSH_HEX_LEN, TLSH_HEX_LEN + 2)  # without / with "T1"
+TLSH_ROW_LEN = 35
+
+# Row layout
+CHECKSUM_COL = 0
+LVALUE_COL = 1
+QRATIO_COL = 2
+BODY_START = 3
+
+RANGE_LVALUE = 256
+RANGE_QRATIO = 16
+
+# Set bits per byte value, for NumPy versions without np.bitwise_count
+_POPCOUNT_LUT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def decode_tlsh(tlsh_hash):
+    """
+    Decode a TLSH hex digest into a 35-byte row.
+
+    The "T1" version prefix is ignored. The Lvalue byte is stored
+    nibble-swapped in the hex digest, so it is swapped back here to keep
+    its numeric value usable for the length distance.
+
+    Args:
+        tlsh_hash (str): TLSH digest, e.g. "T1ABC123..."
+
+    Returns:
+        np.ndarray: uint8 array of shape (35,)
+
+    Raises:
+        ValueError: If the digest is not a valid 35-byte TLSH hash
+                    (e.g. "TNULL" or truncated values)
+
+    Example:
+        >>> row = decode_tlsh("T1C431327820540C8F...")
+        >>> row.shape
+        (35,)
+    """
+    if len(tlsh_hash) not in TLSH_DIGEST_LENGTHS:
+        raise ValueError(f"Invalid TLSH hash length: {len(tlsh_hash)}")
+
+    hex_digest = tlsh_hash[-TLSH_HEX_LEN:]
+    row = np.frombuffer(bytes.fromhex(hex_digest), dtype=np.uint8).copy()
+    lvalue = int(row[LVALUE_COL])
+    row[LVALUE_COL] = ((lvalue & 0x0F) << 4) | (lvalue >> 4)
+    return row
+
+
+def decode_tlsh_batch(tlsh_hashes):
+    """
+    Decode many TLSH hex digests into an (N, 35) matrix at once.
+
+    All digests are joined and hex-decoded in a single bytes.fromhex()
+    call, and the Lvalue nibbles of the whole column are swapped in one
+    vectorized step, instead of decoding row by row.
+
+    Args:
+        tlsh_hashes (list): TLSH digests, each of a length in
+                            TLSH_DIGEST_LENGTHS
+
+    Returns:
+        np.ndarray: uint8 matrix of shape (N, 35), one row per digest
+
+    Raises:
+        ValueError: If any digest has the wrong length or isn't hex
+
+    Example:
+        >>> matrix = decode_tlsh_batch(["T1...", "T1..."])
+        >>> matrix.shape
+        (2, 35)
+    """
+    for tlsh_hash in tlsh_hashes:
+        if len(tlsh_hash) not in TLSH_DIGEST_LENGTHS:
+            raise ValueError(f"Invalid TLSH hash length: {len(tlsh_hash)}")
+
+    hex_digests = "".join(tlsh_hash[-TLSH_HEX_LEN:] for tlsh_hash in tlsh_hashes)
+    matrix = np.frombuffer(bytes.fromhex(hex_digests), dtype=np.uint8)
+    matrix = matrix.reshape(-1, TLSH_ROW_LEN).copy()
+    lvalues = matrix[:, LVALUE_COL]
+    matrix[:, LVALUE_COL] = ((lvalues & 0x0F) << 4) | (lvalues >> 4)
+    return matrix
+
+
+def body_fingerprints(matrix):
+    """
+    Pack the 32 body bytes of every row into four 64-bit words.
+
+    Args:
+        matrix (np.ndarray): Decoded digests of shape (N, 35)
+
+    Returns:
+        np.ndarray: Contiguous uint64 array of shape (N, 4)
+
+    Example:
+        >>> fingerprints = body_fingerprints(matrix)
+        >>> fingerprints.shape
+        (N, 4)
+    """
+    body = np.ascontiguousarray(matrix[:, BODY_START:])
+    return body.view(np.uint64)
+
+
+def tlsh_lower_bounds(query, matrix, fingerprints):
+    """
+    Compute a cheap lower bound of the TLSH distance to every row.
+
+    The header terms (Lvalue, Q ratios and checksum) are exact and only
+    cost a table lookup each; a large length difference alone usually
+    rules a row out. For the body, each 2-bit bucket that differs by 1
+    flips at most 2 bits, one that differs by 2 flips 1 bit and one that
+    differs by 3 flips 2 bits (and counts 6), so half the popcount of the
+    XOR of the bodies, rounded up, never exceeds the body distance.
+
+    Args:
+        query (np.ndarray): Decoded digest of shape (35,)
+        matrix (np.ndarray): Decoded digests of shape (N, 35)
+        fingerprints (np.ndarray): body_fingerprints(matrix), shape (N, 4)
+
+    Returns:
+        np.ndarray: int32 array of shape (N,), each value <= the distance
+                    tlsh_distances() returns for that row
+
+    Example:
+        >>> bounds = tlsh_lower_bounds(query, matrix, fingerprints)
+        >>> candidates = np.flatnonzero(bounds <= cutoff)
+    """
+    bounds = _LVALUE_DIFF[query[LVALUE_COL], matrix[:, LVALUE_COL]].astype(np.int32)
+    bounds += _QRATIO_DIFF[query[QRATIO_COL], matrix[:, QRATIO_COL]]
+    bounds += matrix[:, CHECKSUM_COL] != query[CHECKSUM_COL]
+
+    xor = fingerprints ^ body_fingerprints(query[None, :])[0]
+    if hasattr(np, "bitwise_count"):
+        bits = np.bitwise_count(xor).sum(axis=1, dtype=np.int32)
+    else:
+        bits = _POPCOUNT_LUT[xor.view(np.uint8)].sum(axis=1, dtype=np.int32)
+    bounds += (bits + 1) // 2
+
+    return bounds
+
+
+def _mod_diff(a, b, value_range):
+    """
+    Circular distance between two arrays of values in [0, value_range).
+
+    Args:
+        a (np.ndarray): int16 values
+        b (int | np.ndarray): int16 values
+        value_range (int): Size of the circular range
+
+    Returns:
+        np.ndarray: Element-wise min(|a - b|, value_range - |a - b|)
+    """
+    d = np.abs(a - b)
+    return np.minimum(d, value_range - d)
+
+
+def _build_diff_tables():
+    """
+    Precompute the distance contributed by every pair of byte values.
+
+    Returns:
+        tuple: Three (256, 256) tables indexed by [query byte, row byte]:
+            - Lvalue distance (int16)
+            - Q ratios distance, both 4-bit ratios of the byte (int16)
+            - Body distance, the four 2-bit buckets of the byte (uint8)
+    """
+    values = np.arange(256, dtype=np.int16)
+    a = values[:, None]
+    b = values[None, :]
+
+    ldiff = _mod_diff(a, b, RANGE_LVALUE)
+    lvalue = np.where(ldiff <= 1, ldiff, ldiff * 12).astype(np.int16)
+
+    qratio = np.zeros((256, 256), dtype=np.int16)
+    for shift in (0, 4):
+        qdiff = _mod_diff((a >> shift) & 0x0F, (b >> shift) & 0x0F, RANGE_QRATIO)
+        qratio += np.where(qdiff <= 1, qdiff, (qdiff - 1) * 12).astype(np.int16)
+
+    body = np.zeros((256, 256), dtype=np.uint8)
+    for shift in (0, 2, 4, 6):
+        bdiff = np.abs(((a >> shift) & 0x03) - ((b >> shift) & 0x03))
+        bdiff[bdiff == 3] = 6
+        body += bdiff.astype(np.uint8)
+
+    return lvalue, qratio, body
+
+
+# Distance lookup tables, so a query costs one table gather per byte
+_LVALUE_DIFF, _QRATIO_DIFF, _BODY_DIFF = _build_diff_tables()
+_BODY_COLS = np.arange(TLSH_ROW_LEN - BODY_START)
+
+# SWAR masks: the low bit of every 2-bit bucket in a 64-bit word
+_LOW_BITS = np.uint64(0x5555555555555555)
+_ONE = np.uint64(1)
+
+
+def _body_distances_swar(query, fingerprints):
+    """
+    Body distance to every row, computed on 64-bit words (SWAR).
+
+    With x = a ^ b split into its high (h) and low (l) bit of each bucket:
+    l only means a difference of 1, h only a difference of 2, and both
+    bits mean 0 vs 3 (counts 6) when the query bucket has equal bits,
+    1 vs 2 (counts 1) otherwise. Each case is counted with a popcount.
+
+    Args:
+        query (np.ndarray): Decoded digest of shape (35,)
+        fingerprints (np.ndarray): body_fingerprints() of the rows, (N, 4)
+
+    Returns:
+        np.ndarray: int32 array of shape (N,) with the body distances
+    """
+    q_fp = body_fingerprints(query[None, :])[0]
+    x = fingerprints ^ q_fp
+    high = (x >> _ONE) & _LOW_BITS
+    low = x & _LOW_BITS
+    both = high & low
+    q_equal_bits = ~((q_fp >> _ONE) ^ q_fp) & _LOW_BITS
+
+    bits = np.bitwise_count(low).astype(np.int32)
+    bits += 2 * np.bitwise_count(high)
+    bits -= 2 * np.bitwise_count(both)
+    bits += 5 * np.bitwise_count(both & q_equal_bits)
+    return bits.sum(axis=1, dtype=np.int32)
+
+
+def tlsh_distances(query, matrix, fingerprints=None):
+    """
+    Compute the TLSH distance between a query and every matrix row.
+
+    Vectorized equivalent of calling tlsh.diff(query, row) for each row,
+    computed with per-byte lookup tables (and SWAR popcounts for the body
+    when the rows' fingerprints are given and NumPy has bitwise_count):
+        - Lvalue: 0/1 if the circular distance is 0/1, else distance * 12
+        - Q ratios: distance if <= 1, else (distance - 1) * 12, for each
+          of the two 4-bit ratios
+        - Checksum: +1 if different
+        - Body: sum over the 128 2-bit buckets of |a - b|, where a
+          difference of 3 counts as 6
+
+    Args:
+        query (np.ndarray): Decoded digest of shape (35,)
+        matrix (np.ndarray): Decoded digests of shape (N, 35)
+        fingerprints (np.ndarray): Optional body_fingerprints(matrix)
+
+    Returns:
+        np.ndarray: int32 array of shape (N,) with the distances
+                    (0 = identical, larger = more different)
+
+    Example:
+        >>> matrix = np.stack([decode_tlsh(h) for h in db_hashes])
+        >>> distances = tlsh_distances(decode_tlsh(uploaded_hash), matrix)
+        >>> closest = distances.argmin()
+    """
+    # Header: length, Q ratios and checksum
+    distances = _LVALUE_DIFF[query[LVALUE_COL], matrix[:, LVALUE_COL]].astype(np.int32)
+    distances += _QRATIO_DIFF[query[QRATIO_COL], matrix[:, QRATIO_COL]]
+    distances += matrix[:, CHECKSUM_COL] != query[CHECKSUM_COL]
+
+    if fingerprints is not None and hasattr(np, "bitwise_count"):
+        distances += _body_distances_swar(query, fingerprints)
+        return distances
+
+    # Body: one (32, 256) table per query, row byte -> distance of its four
+    # 2-bit buckets to the query's byte in the same column
+    body_diff = _BODY_DIFF[query[BODY_START:]]
+    distances += body_diff[_BODY_COLS, matrix[:, BODY_START:]].sum(
+        axis=1, dtype=np.int32
+    )
+
+    return distances